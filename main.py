@@ -3,8 +3,11 @@ if __name__ == '__main__':
     from PyQt5.QtWidgets import QApplication
     import sys
     from src.app import App
+    import src.solverpool as solverpool
 
     app = QApplication(sys.argv)
     ex = App()
     ex.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    exit_code = app.exec_()
+    solverpool.shutdown_pool()
+    sys.exit(exit_code)
\ No newline at end of file
@@ -2,9 +2,9 @@ if __name__ == "__main__":
     
     from time import time
     from json import load
-    from functools import cmp_to_key
     from src.spellcast import Spellcast
-    from src.searchnode import SearchNode
+    import src.planner as planner
+    import src.ranking as ranking
     game = Spellcast()
 
     def main():
@@ -17,28 +17,37 @@ if __name__ == "__main__":
         start_time = time()
         print("searching for moves...")
 
-        def compare_moves(a: SearchNode, b: SearchNode):
-            a_score = a.estimated_long_term_score(game)
-            b_score = b.estimated_long_term_score(game)
+        if config["gemManagement"]:
+            move_ranking = ranking.GemRanking(config["movesShown"])
+        else:
+            move_ranking = ranking.ScoreRanking(config["movesShown"])
 
-            difference = a_score - b_score
-            if difference == 0:
-                return a.gem_count() - b.gem_count()
-            else:
-                return difference
+        if config["lookaheadMoves"]:
+            move_ranking = planner.LookaheadRanking(move_ranking, config["lookaheadMoves"], config["lookaheadRollouts"], config["lookaheadTimeMs"])
 
+        top_k = None if config["gemManagement"] else max(config["movesShown"], config["lookaheadMoves"])
 
-        best_moves = game.legal_moves(
-            cmp_to_key(compare_moves)
-            if config["gemManagement"]
-            else SearchNode.score
-        )
+        if config["timeBudgetMs"]:
+            best_moves, complete = game.solve(config["timeBudgetMs"], move_ranking, top_k=top_k)
+            if not complete:
+                print(f"time budget of {config['timeBudgetMs']}ms ran out, showing the best moves found so far\n")
+        else:
+            best_moves = game.legal_moves(move_ranking, top_k=top_k)
+
+        lookahead = move_ranking.stats if config["lookaheadMoves"] else []
 
         for i, node in enumerate(best_moves[:config["movesShown"]]):
             word, score, gem, coordinates, swap_strings = node.to_string(game)
             print(f"{i + 1} > {word} - {score} points - {gem} gems")
             if swap_strings: print(f"   Swaps: {swap_strings}")
             print(f"   Coordinates: {' -> '.join(map(str, coordinates))}")
+            if i < len(lookahead) and lookahead[i][0] is not None:
+                mean, variance, rollouts = lookahead[i]
+                spread = "" if variance is None else f"sd {variance ** 0.5:.1f}, "
+                print(f"   Lookahead: {mean:.1f} points by the end of the match ({spread}{rollouts} rollouts)")
             print()
 
+        if config["timingReport"]:
+            print(game.timing_report())
+
     main()
\ No newline at end of file
@@ -11,10 +11,9 @@ class CaptureThread(QThread):
     result_ready = pyqtSignal(list, list, list, Image.Image)
     error_occurred = pyqtSignal(int)
     
-    def __init__(self, window_name, swap, scan, parent=None):
+    def __init__(self, window_name, scan, parent=None):
         super(CaptureThread, self).__init__(parent)
         self.window_name = window_name
-        self.swap = swap
         self.scan = scan
     
     def run(self):
@@ -30,17 +29,21 @@ class CaptureThread(QThread):
         batch, checks = self.scan.get_cells(board)
         chars = self.scan.get_chars(batch)
         ocrtime = round(time.time() - start, 2)
-        results = self.scan.run(checks, chars, self.swap)
+        results_by_swaps = self.scan.run_all(checks, chars)
         solvetime = round(time.time() - start - ocrtime, 2)
         
-        timedata = [ocrtime, solvetime, round(ocrtime + solvetime, 2)]
+        timedata = [ocrtime, solvetime, round(ocrtime + solvetime, 2), self.scan.search_complete]
         data = []
         coord_data = []
         
-        for i, node in enumerate(results):
-            word, score, gem, coordinates, swap_strings = node.to_string(self.scan.game)
-            data.append(f"{i + 1} > {word} - {score} points - {gem} gems")
-            coord_data.append([coordinates, swap_strings])
+        # one list of results per swap option, so switching options doesn't need another solve
+        for results in results_by_swaps:
+            data.append([])
+            coord_data.append([])
+            for i, node in enumerate(results):
+                word, score, gem, coordinates, swap_strings = node.to_string(self.scan.game)
+                data[-1].append(f"{i + 1} > {word} - {score} points - {gem} gems")
+                coord_data[-1].append([coordinates, swap_strings])
         
         return self.result_ready.emit(data, timedata, coord_data, board)
 
@@ -51,6 +54,8 @@ class App(QWidget):
         self.initUI()
         self.board = None
         self.coord_data = None
+        self.swap_data = None
+        self.swap_coord_data = None
         self.capturing = False
         self.scan = AutoScan()
 
@@ -112,6 +117,7 @@ class App(QWidget):
         self.option_dropdown = QComboBox()
         self.option_dropdown.addItems(['0', '1', '2'])
         self.option_dropdown.setFixedWidth(230)
+        self.option_dropdown.currentIndexChanged.connect(self.swap_select)
 
         self.capture_button = QPushButton('Capture')
         self.capture_button.clicked.connect(self.start_capture)
@@ -185,14 +191,13 @@ class App(QWidget):
                 self.on_error_occurred(0)
 
         selected_window = self.window_dropdown.currentText()
-        selected_swap = int(self.option_dropdown.currentText())
 
         # Start the button text animation
         self.animation_step = 1
         self.animation_timer.start(500)
 
         # Create and start a thread for the capture process
-        self.capture_thread = CaptureThread(selected_window, selected_swap, self.scan)
+        self.capture_thread = CaptureThread(selected_window, self.scan)
         self.capture_thread.result_ready.connect(self.on_capture_complete)
         self.capture_thread.error_occurred.connect(self.on_error_occurred)
         self.capture_thread.start()
@@ -212,19 +217,29 @@ class App(QWidget):
         self.animation_timer.stop()
         self.capture_button.setText("Capture")
 
-        self.coord_data = coord_data
+        self.swap_data = data
+        self.swap_coord_data = coord_data
         self.board = board
 
-        self.left_dropdown.clear()
-        self.left_dropdown.addItems(data)
+        self.swap_select()
 
         # Update time labels
         self.total_time_label.setText(f"OCR Time: {time_data[0]}s")
-        self.ocr_time_label.setText(f"Solving Time: {time_data[1]}s")
+        partial = "" if time_data[3] else " (partial)"
+        self.ocr_time_label.setText(f"Solving Time: {time_data[1]}s{partial}")
         self.solving_time_label.setText(f"Total Time: {time_data[2]}s")
 
+    def swap_select(self):
+        if self.swap_data is None: return
+
+        swap = int(self.option_dropdown.currentText())
+        self.coord_data = self.swap_coord_data[swap]
+        self.left_dropdown.clear()
+        self.left_dropdown.addItems(self.swap_data[swap])
+
     def solution_select(self):
         i = self.left_dropdown.currentIndex()
+        if i < 0: return
         coordinates, swapstrings = self.coord_data[i]
         image = self.scan.coordinator(self.board, coordinates, swapstrings)
         data = image.convert("RGBA").tobytes("raw", "RGBA")
@@ -2,21 +2,148 @@ import win32ui, win32gui, cv2, math, json, logging
 import numpy as np
 from ctypes import windll
 from PIL import Image, ImageDraw, ImageFont
-from src.searchnode import SearchNode
 from src.spellcast import Spellcast
-from functools import cmp_to_key
-from scipy.ndimage import label
+from src.glyphcache import GlyphCache, glyph_key, glyph_bitmap
+from src.lrucache import atomic_write
+import src.planner as planner
+import src.ranking as ranking
+import src.solverpool as solverpool
+import pickle
+from scipy.ndimage import label, generate_binary_structure
 from paddleocr.ppocr.utils.logging import get_logger
 from paddleocr import PaddleOCR
 
 logger = get_logger()
 logger.setLevel(logging.ERROR)
 
-ocr = PaddleOCR(use_angle_cls=False, lang='en')
+# one recognizer batch holds a whole board
+ocr = PaddleOCR(use_angle_cls=False, lang='en', rec_batch_num=25)
+
+# colours of the X2, DL, TL and GEM markers in the order of a cell's checks,
+# how far each channel may be off and how many pixels of a cell make one
+MODIFIER_COLORS = np.array([[255, 35, 235], [255, 255, 170], [235, 122, 67], [255, 114, 255]], dtype=np.int16)
+MODIFIER_THRESHOLDS = np.array([0, 20, 40, 20], dtype=np.int16)
+MODIFIER_MIN_PIXELS = np.array([400, 50, 50, 1])
+
+# for every channel value, a bitmask of the modifiers that value is close
+# enough to, so a pixel's matches are the masks of its channels ANDed together,
+# and the modifiers in each of those bitmasks as a 0/1 row
+CHANNEL_VALUES = np.arange(256, dtype=np.int16)
+MODIFIER_BITS = 1 << np.arange(len(MODIFIER_COLORS))
+CHANNEL_MODIFIERS = np.stack([
+    ((np.abs(CHANNEL_VALUES[:, None] - MODIFIER_COLORS[:, channel]) <= MODIFIER_THRESHOLDS) * MODIFIER_BITS).sum(axis=1)
+    for channel in range(3)
+]).astype(np.uint8)
+MODIFIER_CODE_BITS = (np.arange(1 << len(MODIFIER_COLORS))[:, None] & MODIFIER_BITS != 0).astype(np.int64)
+
+# glyphs are labeled as one stack, so pixels only connect within their own glyph
+GLYPH_STACK_STRUCTURE = np.stack([np.zeros((3, 3), dtype=bool), generate_binary_structure(2, 1), np.zeros((3, 3), dtype=bool)])
+
+# PaddleOCR reads at least this confident are learned as letter templates
+TEMPLATE_LEARN_CONFIDENCE = 0.95
+# a glyph is read from the templates when it correlates this closely with
+# one of them, and by this much more than with any other
+TEMPLATE_MATCH_CORRELATION = 0.95
+TEMPLATE_MATCH_MARGIN = 0.05
+# and its bounding box is within this fraction of the template's aspect ratio
+TEMPLATE_ASPECT_TOLERANCE = 0.2
+
+def normalized_rows(rows):
+    # rows shifted to a mean of 0 and scaled to a length of 1, so the dot
+    # product of two of them is their correlation
+    rows = rows - rows.mean(axis=1, keepdims=True)
+    lengths = np.linalg.norm(rows, axis=1, keepdims=True)
+    return rows / np.maximum(lengths, 1e-9)
+
+class LetterTemplates():
+    # A bank of one template per letter, the mean glyph_bitmap of every
+    # glyph PaddleOCR read as that letter with high confidence. Tiles use
+    # one font at one scale, so most glyphs can be read by correlating them
+    # with the templates, leaving the recognizer for the ones that don't
+    # clearly match a single letter.
+    def __init__(self, path=None):
+        self.path = path
+        self.bitmap_sums = {}
+        self.aspect_sums = {}
+        self.counts = {}
+        self.templates = None
+
+        if path is not None:
+            self.load()
+
+    def learn(self, bitmap, text, confidence):
+        letter = text.strip().upper()
+        if bitmap is None or confidence < TEMPLATE_LEARN_CONFIDENCE or len(letter) != 1 or not letter.isalpha():
+            return False
+
+        aspect, dark_fractions = bitmap
+        self.bitmap_sums[letter] = self.bitmap_sums.get(letter, 0) + dark_fractions.astype(np.float64)
+        self.aspect_sums[letter] = self.aspect_sums.get(letter, 0) + aspect
+        self.counts[letter] = self.counts.get(letter, 0) + 1
+        self.templates = None
+        return True
+
+    def template_rows(self):
+        # (letters, their normalized mean bitmaps, their mean aspect ratios)
+        if self.templates is None and self.counts:
+            letters = sorted(self.counts)
+            self.templates = (
+                letters,
+                normalized_rows(np.stack([self.bitmap_sums[letter].ravel() / self.counts[letter] for letter in letters])),
+                np.array([self.aspect_sums[letter] / self.counts[letter] for letter in letters])
+            )
+        return self.templates
+
+    def match(self, bitmaps):
+        # (letter, correlation) for every bitmap that clearly matches one
+        # template, None for the rest
+        matches = [None] * len(bitmaps)
+        templates = self.template_rows()
+        glyph_indices = [i for i, bitmap in enumerate(bitmaps) if bitmap is not None]
+        if templates is None or not glyph_indices:
+            return matches
+
+        letters, template_rows, template_aspects = templates
+        glyph_rows = normalized_rows(np.stack([bitmaps[i][1].ravel().astype(np.float64) for i in glyph_indices]))
+        glyph_aspects = np.array([bitmaps[i][0] for i in glyph_indices])
+
+        correlations = glyph_rows @ template_rows.T
+        correlations[np.abs(glyph_aspects[:, None] / template_aspects[None, :] - 1) > TEMPLATE_ASPECT_TOLERANCE] = -1
+
+        best = correlations.argmax(axis=1)
+        ranked = np.sort(correlations, axis=1)
+        runner_up = ranked[:, -2] if len(letters) > 1 else np.full(len(glyph_indices), -1.0)
+
+        for row, i in enumerate(glyph_indices):
+            correlation = ranked[row, -1]
+            if correlation >= TEMPLATE_MATCH_CORRELATION and correlation - runner_up[row] >= TEMPLATE_MATCH_MARGIN:
+                matches[i] = (letters[best[row]], float(correlation))
+        return matches
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                self.bitmap_sums, self.aspect_sums, self.counts = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with atomic_write(self.path) as file:
+            pickle.dump((self.bitmap_sums, self.aspect_sums, self.counts), file)
 
 class AutoScan():
     def __init__(self):
         self.game = Spellcast()
+        self.search_complete = True
+        config = json.load(open("config.json"))
+        self.glyph_cache = GlyphCache(config["glyphCacheSize"], config["glyphCachePath"] or None)
+        self.letter_templates = LetterTemplates(config["letterTemplatesPath"] or None)
+        self.glyph_buffer = None
+        # start the workers now so the first capture doesn't wait for them
+        solverpool.get_pool()
 
     def draw_arrow(self, draw, start, end, color='red', width=3, arrow_size=15, shorten_factor=0.2):
         # Calculate the direction vector
@@ -89,34 +216,36 @@ class AutoScan():
         
         return board_copy
 
-    def seperator(self, image):
-        image_array = np.array(image)
-        black_mask = (image_array[:, :, 0] < 50) & (image_array[:, :, 1] < 50) & (image_array[:, :, 2] < 50)
-        labeled_mask, _ = label(black_mask)
-        sizes = np.bincount(labeled_mask.ravel())
-        sizes[0] = 0 
-        largest_component = np.argmax(sizes)
-        final_mask = np.zeros_like(black_mask, dtype=bool)
-        final_mask[labeled_mask == largest_component] = True
-        output_image = np.ones_like(image_array) * 255
-        output_image[final_mask] = image_array[final_mask]
-        return Image.fromarray(output_image)
-
-    def check_color(self, image, color, thres=20, exact=False, density_check=False, min_density=20):
-        image_array = np.array(image)
-        target_color = np.array(color)
-
-        if exact:
-            color_mask = np.all(image_array == target_color, axis=-1)
-        else:
-            diff = np.abs(image_array - target_color)
-            color_mask = np.all(diff <= thres, axis=-1)
-
-        if density_check:
-            matching_pixels = np.sum(color_mask)
-            return matching_pixels >= min_density
-
-        return np.any(color_mask)
+    def seperator(self, glyphs):
+        # Keeps the largest dark component of every glyph in a stack of them
+        # and whitens everything else, a glyph without any dark pixels being
+        # left as it is. The whole stack is labeled in one pass, and since
+        # labels are handed out in scan order each glyph's labels follow on
+        # from the last glyph's. The glyphs come back as views of a buffer
+        # that the next board's glyphs are written over.
+        black_mask = (glyphs[..., 0] < 50) & (glyphs[..., 1] < 50) & (glyphs[..., 2] < 50)
+        labeled_mask, component_count = label(black_mask, GLYPH_STACK_STRUCTURE)
+        sizes = np.bincount(labeled_mask[black_mask], minlength=component_count + 1)
+
+        last_labels = np.maximum.accumulate(labeled_mask.reshape(len(glyphs), -1).max(axis=1))
+        component_glyphs = np.repeat(np.arange(len(glyphs)), np.diff(last_labels, prepend=0))
+
+        # biggest component first within every glyph, lowest label on ties
+        order = np.lexsort((-sizes[1:], component_glyphs))
+        first_components = np.ones(len(order), dtype=bool)
+        first_components[1:] = component_glyphs[order][1:] != component_glyphs[order][:-1]
+
+        kept_labels = np.zeros(component_count + 1, dtype=bool)
+        kept_labels[order[first_components] + 1] = True
+        final_mask = kept_labels[labeled_mask]
+        final_mask[np.diff(last_labels, prepend=0) == 0] = True
+
+        if self.glyph_buffer is None or self.glyph_buffer.shape != glyphs.shape:
+            self.glyph_buffer = np.empty_like(glyphs)
+
+        self.glyph_buffer.fill(255)
+        self.glyph_buffer[final_mask] = glyphs[final_mask]
+        return list(self.glyph_buffer)
 
     def find_discord_window(self):
         name = str(input("INPUT GAME WINDOW: "))
@@ -193,34 +322,66 @@ class AutoScan():
         return image
 
     def get_cells(self, board):
+        # Every pixel of the board is looked up as a bitmask of the modifier
+        # colours it matches, and one bincount over (cell, bitmask) counts
+        # them per cell, giving which modifiers each cell has enough of. The
+        # middle of every cell is cut out into one stack for the seperator.
+        board_array = np.asarray(board)
         cell_width = board.width // 5
         cell_height = board.height // 5
 
-        batch = []
-        checks = []
-        for i in range(5):
-            for j in range(5):
-                left = j * cell_width
-                upper = i *  cell_height
-                right = left + cell_width
-                lower = upper + cell_height
-                cell_image = board.crop((left, upper, right, lower))
-
-                cropped_image = cell_image.crop((cell_width//4, cell_height//4, cell_width-(cell_width//4), cell_height-(cell_height//4)))
-                batch.append(self.seperator(cropped_image))
-                
-                DL = self.check_color(cell_image, [255, 255, 170], density_check=True, min_density=50)
-                TL = self.check_color(cell_image, [235, 122, 67], thres=40, density_check=True, min_density=50)
-                GEM = self.check_color(cell_image, [255, 114, 255])
-                X2 = self.check_color(cell_image, [255, 35, 235], exact=True, density_check=True, min_density=400)
-
-                checks.append([X2, DL, TL, GEM])
+        cells = board_array[:cell_height * 5, :cell_width * 5]
+        modifier_codes = CHANNEL_MODIFIERS[0][cells[..., 0]] & CHANNEL_MODIFIERS[1][cells[..., 1]] & CHANNEL_MODIFIERS[2][cells[..., 2]]
+
+        cell_indices = np.arange(5).repeat(cell_height)[:, None] * 5 + np.arange(5).repeat(cell_width)
+        code_count = len(MODIFIER_CODE_BITS)
+        code_counts = np.bincount((cell_indices * code_count + modifier_codes).ravel(), minlength=25 * code_count)
+        pixel_counts = code_counts.reshape(5, 5, code_count) @ MODIFIER_CODE_BITS
+        modifiers = pixel_counts >= MODIFIER_MIN_PIXELS
+
+        cell_stack = board_array[:cell_height * 5, :cell_width * 5].reshape(5, cell_height, 5, cell_width, -1).swapaxes(1, 2)
+        glyphs = cell_stack[:, :, cell_height // 4:cell_height - cell_height // 4, cell_width // 4:cell_width - cell_width // 4]
+
+        batch = self.seperator(glyphs.reshape(25, *glyphs.shape[2:]))
+        checks = [[bool(check) for check in cell_modifiers] for cell_modifiers in modifiers.reshape(25, -1)]
         
         return batch, checks
 
+    def recognize(self, batch):
+        # every glyph goes through the recognizer in a single call, which is
+        # what ocr.ocr(det=False) runs per image, giving (text, confidence) each
+        results, _ = ocr.text_recognizer([np.array(img) for img in batch])
+        return results
+
     def get_chars(self, batch):
-        chars = [ocr.ocr(np.array(img), det=False, rec=True)[0][0][0]
-                for img in batch] 
+        # Glyphs that look like one recognized before come from the glyph
+        # cache, between turns that's all but the tiles of the played word.
+        # New ones are matched against the letter templates, and only the
+        # ones no template clearly matches go to the recognizer, whose
+        # confident reads become templates in turn.
+        glyphs = [np.asarray(glyph) for glyph in batch]
+        keys = [glyph_key(glyph) for glyph in glyphs]
+
+        results = {key: self.glyph_cache.get(key) for key in dict.fromkeys(keys)}
+        unknown_glyphs = {key: glyph for key, glyph in zip(keys, glyphs) if results[key] is None}
+
+        if unknown_glyphs:
+            bitmaps = {key: glyph_bitmap(glyph) for key, glyph in unknown_glyphs.items()}
+            for key, match in zip(bitmaps, self.letter_templates.match(list(bitmaps.values()))):
+                results[key] = match
+
+            unread_keys = [key for key in unknown_glyphs if results[key] is None]
+            if unread_keys:
+                for key, result in zip(unread_keys, self.recognize([unknown_glyphs[key] for key in unread_keys])):
+                    results[key] = result
+                    self.letter_templates.learn(bitmaps[key], *result)
+                self.letter_templates.save()
+
+            for key in unknown_glyphs:
+                self.glyph_cache.put(key, results[key])
+            self.glyph_cache.save()
+
+        chars = [results[key][0] for key in keys]
         return chars
 
     def process_char(self, checks, char, index, plain=False):
@@ -234,7 +395,7 @@ class AutoScan():
         if check[3]: char+="!"
         return char
 
-    def run(self, checks, chars, swap=1):
+    def load_game(self, checks, chars, swap):
         processed_chunks = []
         for i in range(0, len(chars), 5):
             chunk = "".join(self.process_char(checks, chars[j], j) for j in range(i, min(i + 5, len(chars))))
@@ -243,31 +404,54 @@ class AutoScan():
         result_string = "\n".join(processed_chunks)
         print(result_string)
 
-        if swap == 0: gem = '0'
-        elif swap == 1: gem = '3'
-        elif swap == 2: gem = '6'
-        self.game.load_data(processed_chunks + [gem, '5'])
+        self.game.load_data(processed_chunks + [str(swap * 3), '5'])
+
+    def sort_key(self, config, plans=1):
+        if config["gemManagement"]:
+            move_ranking = ranking.GemRanking(config["movesShown"])
+        else:
+            move_ranking = ranking.ScoreRanking(config["movesShown"])
+
+        if config["lookaheadMoves"]:
+            # run_all plans out every swap option with the gems it was ranked
+            # with, sharing lookaheadTimeMs between them
+            move_ranking = planner.LookaheadRanking(
+                move_ranking, config["lookaheadMoves"], config["lookaheadRollouts"], config["lookaheadTimeMs"], plans=plans
+            )
+
+        return move_ranking
+
+    def run(self, checks, chars, swap=1):
+        self.load_game(checks, chars, swap)
 
         config = json.load(open("config.json"))
         print("searching for moves...")
 
-        def compare_moves(a: SearchNode, b: SearchNode):
-            a_score = a.estimated_long_term_score(self.game)
-            b_score = b.estimated_long_term_score(self.game)
+        sort_key = self.sort_key(config)
+        top_k = None if config["gemManagement"] else max(config["movesShown"], config["lookaheadMoves"])
 
-            difference = a_score - b_score
-            if difference == 0:
-                return a.gem_count() - b.gem_count()
-            else:
-                return difference
+        if config["timeBudgetMs"]:
+            best_moves, self.search_complete = self.game.solve(config["timeBudgetMs"], sort_key, top_k=top_k)
+        else:
+            best_moves = self.game.legal_moves(sort_key, top_k=top_k)
+            self.search_complete = True
 
-        best_moves = self.game.legal_moves(
-            cmp_to_key(compare_moves)
-            if config["gemManagement"]
-            else SearchNode.score
+        return best_moves[:config["movesShown"]]
+
+    def run_all(self, checks, chars, max_swaps=2):
+        # best moves for every swap option from a single solve
+        self.load_game(checks, chars, max_swaps)
+
+        config = json.load(open("config.json"))
+        print("searching for moves...")
+
+        top_k = None if config["gemManagement"] else max(config["movesShown"], config["lookaheadMoves"])
+        moves_by_swaps = self.game.legal_moves_by_swaps(
+            max_swaps, self.sort_key(config, plans=max_swaps + 1), top_k=top_k, time_budget_ms=config["timeBudgetMs"]
         )
+        self.search_complete = self.game.search_complete
 
-        return best_moves[:config["movesShown"]]
+        return [best_moves[:config["movesShown"]] for best_moves in moves_by_swaps]
 
 
 # hwnd = find_discord_window()
@@ -1,5 +1,5 @@
 from random import randint, choice
-from src.tile import Tile, TileModifier
+from src.tile import Tile, TileModifier, BOARD_SIZE
 from src.searchnode import SearchNode
 import src.dictionary as dictionary
 
@@ -158,6 +158,16 @@ class Board:
             return None
     
 
+    def grid_tiles(self):
+        # the BOARD_SIZE x BOARD_SIZE playable tiles in tile index order,
+        # since rows read from a file can carry characters past the grid
+        return [
+            self.tiles[y][x]
+            for y in range(BOARD_SIZE)
+            for x in range(BOARD_SIZE)
+        ]
+
+
     def adjacent_tiles(self, x: int, y: int):
         for y_offset in range(-1, 2):
             for x_offset in range(-1, 2):
@@ -0,0 +1,150 @@
+from array import array
+from src.dictionary import Trie, WORD_FLAG, alphabet, letter_indices
+from src.tile import letter_values
+import src.dictionary as dictionary
+import numpy as np
+
+node_table = None
+board_tries = {}
+board_word_lists = {}
+max_board_tries = 8
+
+
+def get_node_table():
+    # parent, letter, depth range and letter counts of every node of the
+    # full trie, read straight from the mapped dictionary. Nodes are
+    # numbered breadth first, so the nodes of every depth form a range.
+    global node_table
+
+    if node_table is None:
+        trie = dictionary.trie
+        masks = np.frombuffer(trie.masks, dtype=np.uint32)
+        parents = np.frombuffer(trie.parents, dtype=np.uint32)
+        letters = np.frombuffer(trie.letters, dtype=np.uint8)
+        letter_counts = np.frombuffer(trie.letter_counts, dtype=np.uint8).reshape(-1, len(alphabet))
+
+        # depth only grows with the node number, so every depth is a range
+        depth_ranges = []
+        start, end = 0, 1
+        while start < end:
+            depth_ranges.append((start, end))
+            start, end = end, int(np.searchsorted(parents[1:], end)) + 1
+
+        node_table = (masks, parents, letters, depth_ranges, letter_counts)
+
+    return node_table
+
+
+def board_trie(board_letters: str, max_missing: int):
+    # The part of the full trie spelling words whose letters the board has,
+    # allowing up to max_missing letters to come from swaps. Cached per
+    # board since every unit of a solve asks for the same one.
+    key = (board_letters, max_missing)
+    if key in board_tries:
+        return board_tries[key]
+
+    masks, parents, letters, depth_ranges, letter_counts = get_node_table()
+    trie = dictionary.trie
+
+    board_counts = np.zeros(len(alphabet), dtype=np.uint8)
+    for letter in board_letters:
+        if letter in letter_indices:
+            board_counts[letter_indices[letter]] += 1
+
+    # a letter at a time, so no temporary as large as letter_counts is made
+    missing_letters = np.zeros(len(masks), dtype=np.uint16)
+    for letter_index in range(len(alphabet)):
+        missing_letters += np.maximum(letter_counts[:, letter_index], board_counts[letter_index]) - board_counts[letter_index]
+
+    # keep the words that fit and every prefix leading to them
+    kept = (missing_letters <= max_missing) & (masks & WORD_FLAG != 0)
+    kept[0] = True
+    for start, end in reversed(depth_ranges[1:]):
+        kept_children = start + np.flatnonzero(kept[start:end])
+        kept[parents[kept_children]] = True
+
+    # the kept nodes are still in breadth first order with every node's
+    # children next to each other, so they can be renumbered in place
+    kept_nodes = np.flatnonzero(kept)
+    new_ids = np.zeros(len(masks), dtype=np.int64)
+    new_ids[kept_nodes] = np.arange(len(kept_nodes))
+
+    child_nodes = kept_nodes[1:]
+    new_parents = new_ids[parents[child_nodes]]
+
+    new_masks = masks[kept_nodes] & WORD_FLAG
+    np.bitwise_or.at(new_masks, new_parents, np.left_shift(np.uint32(1), letters[child_nodes].astype(np.uint32)))
+
+    first_children = np.frombuffer(trie.first_children, dtype=np.uint32)
+    new_first_children = np.searchsorted(kept_nodes, first_children[kept_nodes])
+
+    values = np.array([letter_values[letter] for letter in alphabet], dtype=np.int64)
+    heights = np.zeros(len(kept_nodes), dtype=np.int64)
+    suffix_scores = np.zeros(len(kept_nodes), dtype=np.int64)
+
+    for start, end in reversed(depth_ranges[1:]):
+        level = slice(np.searchsorted(kept_nodes, start), np.searchsorted(kept_nodes, end))
+        level_nodes = np.arange(len(kept_nodes))[level]
+        level_parents = new_parents[level_nodes - 1]
+
+        np.maximum.at(heights, level_parents, heights[level_nodes] + 1)
+        np.maximum.at(
+            suffix_scores,
+            level_parents,
+            suffix_scores[level_nodes] + values[letters[kept_nodes[level_nodes]]]
+        )
+
+    cut_trie = Trie(
+        array("I", new_masks.astype(np.uint32).tobytes()),
+        array("I", new_first_children.astype(np.uint32).tobytes()),
+        array("B", heights.astype(np.uint8).tobytes()),
+        array("B", suffix_scores.astype(np.uint8).tobytes()),
+        array("I", kept_nodes.astype(np.uint32).tobytes())
+    )
+
+    if len(board_tries) >= max_board_tries:
+        board_tries.clear()
+
+    board_tries[key] = cut_trie
+    return cut_trie
+
+
+def board_words(board_letters: str, max_missing: int, min_length: int, max_length: int):
+    # (word, word id) of every word in the board's trie with a length in
+    # range, grouped by first letter
+    key = (board_letters, max_missing, min_length, max_length)
+    if key in board_word_lists:
+        return board_word_lists[key]
+
+    masks, parents, letters, depth_ranges, _ = get_node_table()
+    cut_trie = board_trie(board_letters, max_missing)
+
+    kept_nodes = np.frombuffer(cut_trie.word_ids, dtype=np.uint32)
+    word_nodes = kept_nodes[masks[kept_nodes] & WORD_FLAG != 0].astype(np.int64)
+
+    depth_starts = np.array([start for start, _ in depth_ranges])
+    lengths = np.searchsorted(depth_starts, word_nodes, side="right") - 1
+
+    in_range = (lengths >= min_length) & (lengths <= max_length)
+    word_nodes = word_nodes[in_range]
+    lengths = lengths[in_range]
+
+    # spell every word backwards from its last node
+    spellings = np.zeros((len(word_nodes), max_length), dtype=np.uint8)
+    nodes = word_nodes.copy()
+    for step in range(max_length):
+        positions = lengths - 1 - step
+        spelled = positions >= 0
+        spellings[spelled, positions[spelled]] = letters[nodes[spelled]] + ord("a")
+        nodes = parents[nodes]
+
+    words_by_letter = {}
+    for spelling, length, word_node in zip(spellings, lengths, word_nodes):
+        word = spelling.tobytes()[:length].decode()
+        words_by_letter.setdefault(word[0], []).append((word, int(word_node)))
+
+    if len(board_word_lists) >= max_board_tries:
+        board_word_lists.clear()
+
+    board_word_lists[key] = words_by_letter
+    return words_by_letter
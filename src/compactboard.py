@@ -0,0 +1,148 @@
+from random import choice, randrange, sample
+from typing_extensions import Self
+from src.tile import Tile, TileModifier, BOARD_SIZE
+from src.board import Board, BoardTiles
+from src.searchnode import SearchNode
+import src.dictionary as dictionary
+
+
+class CompactBoard:
+    # A board kept as one letter byte per tile plus one bitmask of tile
+    # indices per modifier, so simulations can copy and play boards without
+    # building Tile objects. Tiles are only made when tiles() is asked for.
+    width: int
+    height: int
+    letters: bytearray
+    modifier_masks: dict[str, int]
+    gems: int
+    match_round: int
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        letters: bytearray,
+        modifier_masks: dict[str, int],
+        gems: int = 0,
+        match_round: int = 1
+    ):
+        self.width = width
+        self.height = height
+        self.letters = letters
+        self.modifier_masks = modifier_masks
+        self.gems = gems
+        self.match_round = match_round
+
+
+    def from_board(board: Board):
+        letters = bytearray()
+        modifier_masks = {modifier: 0 for modifier in TileModifier.values}
+
+        for tile_index, tile in enumerate(board.grid_tiles()):
+            letters.append(ord(tile.letter))
+
+            for modifier in tile.modifiers:
+                modifier_masks[modifier] |= 1 << tile_index
+
+        return CompactBoard(BOARD_SIZE, BOARD_SIZE, letters, modifier_masks, board.gems, board.match_round)
+
+
+    def random(width: int, height: int, include_triple_letters: bool = False):
+        # same distribution as Board.load_random
+        tile_count = width * height
+        letters = bytearray(ord(choice(dictionary.alphabet)) for _ in range(tile_count))
+        modifier_masks = {modifier: 0 for modifier in TileModifier.values}
+
+        modifier_masks[TileModifier.DOUBLE_WORD] |= 1 << randrange(tile_count)
+
+        letter_boost = TileModifier.TRIPLE_LETTER if include_triple_letters else TileModifier.DOUBLE_LETTER
+        modifier_masks[letter_boost] |= 1 << randrange(tile_count)
+
+        for tile_index in sample(range(tile_count), 10):
+            modifier_masks[TileModifier.GEM] |= 1 << tile_index
+
+        return CompactBoard(width, height, letters, modifier_masks)
+
+
+    def copy(self) -> Self:
+        return CompactBoard(
+            self.width,
+            self.height,
+            self.letters[:],
+            self.modifier_masks.copy(),
+            self.gems,
+            self.match_round
+        )
+
+
+    def tile(self, tile_index: int):
+        tile = Tile(chr(self.letters[tile_index]), tile_index % self.width, tile_index // self.width)
+
+        tile_bit = 1 << tile_index
+        for modifier, modifier_mask in self.modifier_masks.items():
+            if modifier_mask & tile_bit:
+                tile.modifiers.add(modifier)
+
+        return tile
+
+
+    def tiles(self) -> BoardTiles:
+        return [
+            [self.tile(y * self.width + x) for x in range(self.width)]
+            for y in range(self.height)
+        ]
+
+
+    def load_into(self, board: Board):
+        board.tiles = self.tiles()
+        board.gems = self.gems
+        board.match_round = self.match_round
+        return board
+
+
+    def apply_move(self, path: bytes, swap_count: int):
+        # Board.play_move for a path of tile indices
+        modifier_masks = self.modifier_masks
+        tile_count = len(self.letters)
+
+        path_mask = 0
+        held_letter_boost = None
+
+        for tile_index in path:
+            tile_bit = 1 << tile_index
+            path_mask |= tile_bit
+            self.letters[tile_index] = ord(choice(dictionary.alphabet))
+
+            if modifier_masks[TileModifier.DOUBLE_LETTER] & tile_bit:
+                held_letter_boost = TileModifier.DOUBLE_LETTER
+            elif modifier_masks[TileModifier.TRIPLE_LETTER] & tile_bit:
+                held_letter_boost = TileModifier.TRIPLE_LETTER
+
+        gem_count = (modifier_masks[TileModifier.GEM] & path_mask).bit_count()
+
+        modifier_masks[TileModifier.GEM] &= ~path_mask
+        modifier_masks[TileModifier.DOUBLE_LETTER] &= ~path_mask
+        modifier_masks[TileModifier.TRIPLE_LETTER] &= ~path_mask
+
+        if held_letter_boost is not None:
+            modifier_masks[held_letter_boost] |= 1 << randrange(tile_count)
+
+        available_tiles = [
+            tile_index for tile_index in range(tile_count)
+            if not path_mask & (1 << tile_index)
+        ]
+        for tile_index in sample(available_tiles, min(gem_count, len(available_tiles))):
+            modifier_masks[TileModifier.GEM] |= 1 << tile_index
+
+        # clear the first double word tile and place a new one
+        double_word_mask = modifier_masks[TileModifier.DOUBLE_WORD]
+        double_word_mask &= double_word_mask - 1
+        modifier_masks[TileModifier.DOUBLE_WORD] = double_word_mask | (1 << randrange(tile_count))
+
+        self.gems += gem_count - (swap_count * 3)
+        self.match_round += 1
+
+
+    def play_move(self, move: SearchNode):
+        path = bytes(node.y * self.width + node.x for node in move.chain())
+        self.apply_move(path, move.swap_count())
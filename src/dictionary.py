@@ -1,23 +1,289 @@
+from array import array
+from hashlib import sha1
+from src.lrucache import atomic_write
+from src.tile import letter_values
+import mmap, os, struct
+
 alphabet = list("abcdefghijklmnopqrstuvwxyz")
+letter_indices = {letter: index for index, letter in enumerate(alphabet)}
 
-dictionary = set(
-    open("resources/dictionary.txt").read().splitlines()
-)
+ROOT = 0
+WORD_FLAG = 1 << len(alphabet)
 
-cut_dictionaries = [
-    set(
-        open(f"resources/wordlists/dictionary{word_length}.txt").read().splitlines()
-    )
+SOURCE_PATHS = ["resources/dictionary.txt"] + [
+    f"resources/wordlists/dictionary{word_length}.txt"
     for word_length in range(2, 23)
 ]
+COMPILED_PATH = "resources/dictionary.bin"
+
+# magic, format version, source stamp, node count
+COMPILED_HEADER = struct.Struct("=4sI20sI")
+COMPILED_MAGIC = b"SCDT"
+COMPILED_VERSION = 3
+
+
+def load_words():
+    words = open(SOURCE_PATHS[0]).read().splitlines()
+
+    cut_dictionaries = [
+        set(open(path).read().splitlines())
+        for path in SOURCE_PATHS[1:]
+    ]
+
+    # only keep words whose every prefix is listed in the cut dictionaries,
+    # which is exactly the set of words the search could reach before
+    return [
+        word for word in words
+        if all(
+            word[:prefix_length] in cut_dictionaries[prefix_length - 2]
+            for prefix_length in range(2, len(word) + 1)
+        )
+    ]
+
+
+class Trie:
+    # Every node is an index into two flat arrays. masks holds one bit per
+    # child letter plus WORD_FLAG, and the children of a node are stored
+    # contiguously in alphabetical order starting at first_children[node].
+    # heights holds the length of the longest word suffix below each node
+    # and suffix_scores the highest sum of letter values of any such suffix.
+    # Tries cut down from the full dictionary map their nodes back to the
+    # full trie with word_ids, so words keep the same id in every trie.
+    # The full trie also has the parent and letter of every node and how
+    # many of each letter spell it, 26 counts a node, which board tries are
+    # cut down with. They're mapped from the compiled file like the rest,
+    # so every process shares one copy.
+    masks: array | memoryview
+    first_children: array | memoryview
+    heights: array | memoryview
+    suffix_scores: array | memoryview
+    word_ids: array | None
+    parents: array | memoryview | None
+    letters: array | memoryview | None
+    letter_counts: array | memoryview | None
+
+    def __init__(
+        self,
+        masks: array | memoryview,
+        first_children: array | memoryview,
+        heights: array | memoryview,
+        suffix_scores: array | memoryview,
+        word_ids: array | None = None,
+        parents: array | memoryview | None = None,
+        letters: array | memoryview | None = None,
+        letter_counts: array | memoryview | None = None
+    ):
+        self.masks = masks
+        self.first_children = first_children
+        self.heights = heights
+        self.suffix_scores = suffix_scores
+        self.word_ids = word_ids
+        self.parents = parents
+        self.letters = letters
+        self.letter_counts = letter_counts
+
+
+    def from_words(words: list[str]):
+        root = {}
+        for word in words:
+            node = root
+            for letter in word:
+                node = node.setdefault(letter, {})
+            node[""] = None
+
+        masks = array("I")
+        first_children = array("I")
+        parents = array("I", [0])
+        letters = array("B", [0])
+        queue = [root]
+
+        for node_index, node in enumerate(queue):
+            mask = 0
+            first_children.append(len(queue))
+
+            for letter in sorted(node):
+                if letter == "":
+                    mask |= WORD_FLAG
+                    continue
+
+                mask |= 1 << letter_indices[letter]
+                queue.append(node[letter])
+                parents.append(node_index)
+                letters.append(letter_indices[letter])
+
+            masks.append(mask)
+
+        # a node's letter counts are its parent's plus its own letter
+        letter_counts = array("B", bytes(len(masks) * len(alphabet)))
+        for node in range(1, len(masks)):
+            row = node * len(alphabet)
+            parent_row = parents[node] * len(alphabet)
+            letter_counts[row:row + len(alphabet)] = letter_counts[parent_row:parent_row + len(alphabet)]
+            letter_counts[row + letters[node]] += 1
+
+        # children always come after their parent, so walking backwards
+        # finishes every child before its parent is reached
+        heights = array("B", bytes(len(masks)))
+        suffix_scores = array("B", bytes(len(masks)))
+
+        for node in reversed(range(len(masks))):
+            child_node = first_children[node]
+
+            for letter_index, letter in enumerate(alphabet):
+                if not masks[node] & (1 << letter_index):
+                    continue
+
+                heights[node] = max(heights[node], heights[child_node] + 1)
+                suffix_scores[node] = max(
+                    suffix_scores[node],
+                    suffix_scores[child_node] + letter_values[letter]
+                )
+                child_node += 1
+
+        return Trie(masks, first_children, heights, suffix_scores, None, parents, letters, letter_counts)
+
+
+    def child(self, node: int, letter: str):
+        letter_index = letter_indices.get(letter)
+        if letter_index is None:
+            return None
+
+        mask = self.masks[node]
+        letter_bit = 1 << letter_index
+        if not mask & letter_bit:
+            return None
+
+        return self.first_children[node] + (mask & (letter_bit - 1)).bit_count()
+
+
+    def is_word(self, node: int):
+        return bool(self.masks[node] & WORD_FLAG)
+
+
+    def word_id(self, node: int):
+        return node if self.word_ids is None else self.word_ids[node]
+
+
+    def children(self, node: int):
+        # only visits the letters that have a child, lowest bit first
+        child_mask = self.masks[node] & (WORD_FLAG - 1)
+        child_node = self.first_children[node]
+
+        while child_mask:
+            letter_bit = child_mask & -child_mask
+            child_mask ^= letter_bit
+
+            yield alphabet[letter_bit.bit_length() - 1], child_node
+            child_node += 1
+
+
+    def find(self, prefix: str):
+        node = ROOT
+        for letter in prefix:
+            node = self.child(node, letter)
+            if node is None:
+                return None
+
+        return node
+
+
+def source_stamp():
+    stamp = sha1()
+    for path in SOURCE_PATHS:
+        status = os.stat(path)
+        stamp.update(f"{path}:{status.st_size}:{status.st_mtime_ns};".encode())
+
+    return stamp.digest()
+
+
+def compiled_is_current(path: str = COMPILED_PATH):
+    try:
+        with open(path, "rb") as file:
+            header = file.read(COMPILED_HEADER.size)
+    except OSError:
+        return False
+
+    if len(header) < COMPILED_HEADER.size:
+        return False
+
+    magic, version, stamp, _ = COMPILED_HEADER.unpack(header)
+    return (
+        magic == COMPILED_MAGIC
+        and version == COMPILED_VERSION
+        and stamp == source_stamp()
+    )
+
+
+def compile_dictionary(path: str = COMPILED_PATH):
+    compiled_trie = Trie.from_words(load_words())
+    node_count = len(compiled_trie.masks)
+
+    # processes starting at the same time must never map a half written file
+    with atomic_write(path) as file:
+        file.write(COMPILED_HEADER.pack(
+            COMPILED_MAGIC, COMPILED_VERSION, source_stamp(), node_count
+        ))
+        compiled_trie.masks.tofile(file)
+        compiled_trie.first_children.tofile(file)
+        compiled_trie.heights.tofile(file)
+        compiled_trie.suffix_scores.tofile(file)
+        compiled_trie.parents.tofile(file)
+        compiled_trie.letters.tofile(file)
+        compiled_trie.letter_counts.tofile(file)
+
+    return compiled_trie
+
+
+def load_trie(path: str = COMPILED_PATH):
+    if not compiled_is_current(path):
+        compile_dictionary(path)
+
+    with open(path, "rb") as file:
+        mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    _, _, _, node_count = COMPILED_HEADER.unpack_from(mapped_file)
+    view = memoryview(mapped_file)
+
+    masks_offset = COMPILED_HEADER.size
+    first_children_offset = masks_offset + node_count * 4
+    heights_offset = first_children_offset + node_count * 4
+    suffix_scores_offset = heights_offset + node_count
+    parents_offset = suffix_scores_offset + node_count
+    letters_offset = parents_offset + node_count * 4
+    letter_counts_offset = letters_offset + node_count
+
+    return Trie(
+        view[masks_offset:first_children_offset].cast("I"),
+        view[first_children_offset:heights_offset].cast("I"),
+        view[heights_offset:suffix_scores_offset],
+        view[suffix_scores_offset:parents_offset],
+        None,
+        view[parents_offset:letters_offset].cast("I"),
+        view[letters_offset:letter_counts_offset],
+        view[letter_counts_offset:letter_counts_offset + node_count * len(alphabet)]
+    )
+
+
+trie = load_trie()
+
+def warm():
+    # touch one entry per page so every page of the mapped arrays is resident
+    columns = (
+        trie.masks, trie.first_children, trie.heights, trie.suffix_scores,
+        trie.parents, trie.letters, trie.letter_counts
+    )
+    for column in columns:
+        for index in range(0, len(column), mmap.PAGESIZE // column.itemsize):
+            column[index]
 
 def has_word(word: str):
-    return word in dictionary
+    node = trie.find(word)
+    return node is not None and trie.is_word(node)
 
 def has_prefix(prefix: str):
-    prefix_length = len(prefix)
+    return trie.find(prefix) is not None
 
-    if prefix_length < 2:
-        return True
 
-    return prefix in cut_dictionaries[prefix_length - 2]
\ No newline at end of file
+if __name__ == "__main__":
+    compiled_trie = compile_dictionary()
+    print(f"compiled {len(compiled_trie.masks)} trie nodes into {COMPILED_PATH}")
@@ -1,17 +1,31 @@
+from json import load
+import os
+
+GEM_TABLES_PATH = "resources/gem_tables.json"
+
 AVERAGE_SCORES = [32.7, 57.5, 74, 86]
 AVERAGE_NET_GEM_PROFITS = [2.8, 1, -0.8, -2.6]
 
-def get_gem_value(gem_count: int):
+# tables regenerated from self-play games with `python -m src.selfplay tables`
+gem_tables = load(open(GEM_TABLES_PATH)) if os.path.exists(GEM_TABLES_PATH) else None
+if gem_tables is not None:
+    AVERAGE_SCORES = gem_tables["averageScores"]
+    AVERAGE_NET_GEM_PROFITS = gem_tables["averageNetGemProfits"]
+
+def get_gem_value(gem_count: int, average_scores: list = AVERAGE_SCORES):
     value = 0
     for swap_count in range(1, 4):
         gem_threshold = swap_count * 3
         if gem_count >= gem_threshold:
-            value += AVERAGE_SCORES[swap_count] - AVERAGE_SCORES[swap_count - 1]
+            value += average_scores[swap_count] - average_scores[swap_count - 1]
         elif gem_count > gem_threshold - 3:
-            value += ((AVERAGE_SCORES[swap_count] - AVERAGE_SCORES[swap_count - 1]) / 3) * (gem_count % 3)
+            value += ((average_scores[swap_count] - average_scores[swap_count - 1]) / 3) * (gem_count % 3)
     return round(value, 1)
 
-GEM_VALUE_LOOKUP = [get_gem_value(i) for i in range(11)]
+if gem_tables is not None:
+    GEM_VALUE_LOOKUP = gem_tables["gemValueLookup"]
+else:
+    GEM_VALUE_LOOKUP = [get_gem_value(i) for i in range(11)]
 
 def gem_value(gem_count: float):
     gem_count = int(gem_count)  # Convert to integer
@@ -0,0 +1,58 @@
+from src.lrucache import LRUCache
+import numpy as np
+
+# bumped whenever glyph_key changes, so saved keys from before are dropped
+GLYPH_KEY_VERSION = 2
+GLYPH_GRID = 16
+
+
+def glyph_bitmap(glyph: np.ndarray):
+    # The dark pixels of a glyph from AutoScan.seperator cropped to their
+    # bounding box and averaged down to a 16x16 grid of dark fractions, so
+    # it doesn't matter where the glyph sits in the cell or how big the
+    # board was captured. Returns the box's height over width as well, or
+    # None for a cell without a glyph.
+    dark_mask = np.all(glyph < 50, axis=-1)
+
+    rows = np.flatnonzero(dark_mask.any(axis=1))
+    columns = np.flatnonzero(dark_mask.any(axis=0))
+    if len(rows) == 0:
+        return None
+
+    dark_mask = dark_mask[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+    height, width = dark_mask.shape
+    aspect = height / width
+
+    # glyphs narrower or shorter than the grid are stretched onto it first
+    dark_mask = dark_mask.repeat(-(-GLYPH_GRID // height), axis=0).repeat(-(-GLYPH_GRID // width), axis=1)
+    height, width = dark_mask.shape
+
+    row_starts = np.arange(GLYPH_GRID) * height // GLYPH_GRID
+    column_starts = np.arange(GLYPH_GRID) * width // GLYPH_GRID
+    dark_counts = np.add.reduceat(np.add.reduceat(dark_mask.astype(np.int32), row_starts, axis=0), column_starts, axis=1)
+    cell_sizes = np.outer(np.diff(row_starts, append=height), np.diff(column_starts, append=width))
+
+    return aspect, (dark_counts / cell_sizes).astype(np.float32)
+
+
+def glyph_key(glyph: np.ndarray):
+    # a small hash of a glyph that stays the same across captures of the
+    # same letter, the aspect ratio telling apart glyphs like I and l that
+    # fill the grid alike
+    bitmap = glyph_bitmap(glyph)
+    if bitmap is None:
+        return b""
+
+    aspect, dark_fractions = bitmap
+    return bytes([min(255, round(16 * aspect))]) + np.packbits(dark_fractions >= 0.5).tobytes()
+
+
+class GlyphCache(LRUCache):
+    # Least recently used cache of recognized glyphs keyed by glyph_key,
+    # so cells that look the same as in an earlier capture skip OCR.
+    # Optionally mirrored to a file, saved with save() once a capture is done.
+    name = "glyph cache"
+    entry_name = "glyphs"
+
+    def __init__(self, max_size: int = 256, path: str | None = None):
+        super().__init__(max_size, path, GLYPH_KEY_VERSION)
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import os, pickle
+
+
+@contextmanager
+def atomic_write(path: str):
+    # Yields a binary file to write path's new contents to. It's written
+    # to a temporary file first and only moved over path once complete, so
+    # other processes reading path never see a half written file.
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        yield file
+
+    os.replace(temporary_path, path)
+
+
+class LRUCache:
+    # Least recently used cache, optionally mirrored to a file with save().
+    # A saved file is stored along with the cache's stamp, and only loaded
+    # back while the stamp still matches.
+    name: str = "cache"
+    entry_name: str = "entries"
+    max_size: int
+    path: str | None
+    stamp: object
+    entries: OrderedDict
+    hits: int
+    misses: int
+
+    def __init__(self, max_size: int, path: str | None = None, stamp: object = None):
+        self.max_size = max_size
+        self.path = path
+        self.stamp = stamp
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if path is not None:
+            self.load()
+
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+
+    def put(self, key, entry):
+        if self.max_size <= 0:
+            return
+
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as file:
+                stamp, entries = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            return
+
+        if stamp == self.stamp:
+            self.entries = OrderedDict(list(entries.items())[-self.max_size:])
+
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with atomic_write(self.path) as file:
+            pickle.dump((self.stamp, dict(self.entries)), file)
+
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return f"{self.name}: {self.hits} hits, {self.misses} misses ({hit_rate:.0%}), {len(self.entries)} {self.entry_name}"
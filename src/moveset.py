@@ -0,0 +1,210 @@
+from array import array
+from typing_extensions import Self
+from src.tile import BOARD_SIZE
+from src.searchnode import SearchNode
+
+
+class MoveSet:
+    # The packed moves of a solve stored column by column in flat typed
+    # arrays, around 50 bytes a move rather than a tuple of Python objects
+    # or a whole SearchNode chain. Indexing and iterating make SearchNodes
+    # as they're asked for. Slicing, take() and sort() only change `order`
+    # and share the columns, so only sets built by MoveSet() or compact()
+    # are ever extended.
+    paths: bytearray
+    path_offsets: array
+    swap_masks: array
+    swap_letters: bytearray
+    swap_letter_offsets: array
+    scores: array
+    gem_counts: array
+    word_ids: array
+    tile_masks: array
+    order: array
+    in_row_order: bool
+    context: object | None
+
+    def __init__(self, context=None):
+        self.paths = bytearray()
+        self.path_offsets = array("I", [0])
+        self.swap_masks = array("L")
+        self.swap_letters = bytearray()
+        self.swap_letter_offsets = array("I", [0])
+        self.scores = array("h")
+        self.gem_counts = array("b")
+        self.word_ids = array("q")
+        self.tile_masks = array("L")
+        self.order = array("I")
+        self.in_row_order = True
+        self.context = context
+
+
+    def from_packed(packed_moves, context=None):
+        move_set = MoveSet(context)
+        move_set.extend(packed_moves)
+        return move_set
+
+
+    def __getstate__(self):
+        # only the moves in the set are pickled, without the board
+        state = (self if self.is_compact() else self.compact()).__dict__.copy()
+        state["context"] = None
+        return state
+
+
+    def append(self, packed_move: tuple):
+        path, swap_mask, swap_letters, score, gem_count, word_id, tile_mask = packed_move
+
+        self.order.append(len(self.scores))
+        self.paths += path
+        self.path_offsets.append(len(self.paths))
+        self.swap_masks.append(swap_mask)
+        self.swap_letters += swap_letters.encode()
+        self.swap_letter_offsets.append(len(self.swap_letters))
+        self.scores.append(score)
+        self.gem_counts.append(gem_count)
+        self.word_ids.append(word_id)
+        self.tile_masks.append(tile_mask)
+
+
+    def extend(self, packed_moves):
+        if not isinstance(packed_moves, MoveSet):
+            for packed_move in packed_moves:
+                self.append(packed_move)
+            return
+
+        if not packed_moves.is_compact():
+            packed_moves = packed_moves.compact()
+
+        # a whole set in row order copies over column by column
+        row_count = len(self.scores)
+        path_offset = len(self.paths)
+        swap_letter_offset = len(self.swap_letters)
+
+        self.order.extend(range(row_count, row_count + len(packed_moves.scores)))
+        self.paths += packed_moves.paths
+        self.path_offsets.extend(path_offset + end for end in packed_moves.path_offsets[1:])
+        self.swap_masks.extend(packed_moves.swap_masks)
+        self.swap_letters += packed_moves.swap_letters
+        self.swap_letter_offsets.extend(swap_letter_offset + end for end in packed_moves.swap_letter_offsets[1:])
+        self.scores.extend(packed_moves.scores)
+        self.gem_counts.extend(packed_moves.gem_counts)
+        self.word_ids.extend(packed_moves.word_ids)
+        self.tile_masks.extend(packed_moves.tile_masks)
+
+
+    def packed_row(self, row: int):
+        return (
+            bytes(self.paths[self.path_offsets[row]:self.path_offsets[row + 1]]),
+            self.swap_masks[row],
+            self.swap_letters[self.swap_letter_offsets[row]:self.swap_letter_offsets[row + 1]].decode(),
+            self.scores[row],
+            self.gem_counts[row],
+            self.word_ids[row],
+            self.tile_masks[row]
+        )
+
+
+    def packed(self, index: int):
+        return self.packed_row(self.order[index])
+
+
+    def packed_moves(self):
+        for row in self.order:
+            yield self.packed_row(row)
+
+
+    def view(self, order: array, context=None) -> Self:
+        move_set = MoveSet.__new__(MoveSet)
+        move_set.__dict__.update(self.__dict__)
+        move_set.order = order
+        move_set.in_row_order = False
+        move_set.context = self.context if context is None else context
+        return move_set
+
+
+    def take(self, indices, context=None) -> Self:
+        # the moves at the given indices, in that order
+        order = self.order
+        return self.view(array("I", (order[index] for index in indices)), context)
+
+
+    def is_compact(self):
+        # whether the set holds every row of its columns, in row order
+        return self.in_row_order and len(self.order) == len(self.scores)
+
+
+    def compact(self) -> Self:
+        # a set holding just the moves in this one, in its order
+        move_set = MoveSet(self.context)
+        move_set.extend(self.packed_moves())
+        return move_set
+
+
+    def __len__(self):
+        return len(self.order)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.view(self.order[index])
+
+        return SearchNode.from_packed(self.context, self.packed(index))
+
+
+    def __iter__(self):
+        for row in self.order:
+            yield SearchNode.from_packed(self.context, self.packed_row(row))
+
+
+    def sort(self, key=None, reverse: bool = False):
+        # like list.sort on the SearchNodes, key=None sorting by score
+        if key is None:
+            sort_keys = [self.scores[row] for row in self.order]
+        else:
+            sort_keys = [key(move) for move in self]
+
+        positions = sorted(range(len(self.order)), key=sort_keys.__getitem__, reverse=reverse)
+        self.order = array("I", (self.order[position] for position in positions))
+        self.in_row_order = False
+
+
+    def to_string(self, index: int, context=None):
+        # SearchNode.to_string without making the SearchNode
+        context = self.context if context is None else context
+        path, swap_mask, swap_letters, score, gem_count = self.packed(index)[:5]
+        swapped_letters = iter(swap_letters)
+
+        word = ""
+        coordinates = []
+        swap_strings = {}
+
+        for tile_index in path:
+            x = tile_index % BOARD_SIZE
+            y = tile_index // BOARD_SIZE
+            coordinates.append((x + 1, y + 1))
+
+            if swap_mask & (1 << tile_index):
+                letter = next(swapped_letters)
+                swap_strings[(x + 1, y + 1)] = letter.upper()
+            else:
+                letter = context.tile_at(x, y).letter
+
+            word += letter
+
+        return word, score, gem_count, coordinates, swap_strings
+
+
+    def nbytes(self):
+        # bytes held by the columns, which views share with the set they came from
+        return (
+            len(self.paths)
+            + len(self.swap_letters)
+            + sum(
+                column.itemsize * len(column)
+                for column in (
+                    self.path_offsets, self.swap_masks, self.swap_letter_offsets, self.scores,
+                    self.gem_counts, self.word_ids, self.tile_masks, self.order
+                )
+            )
+        )
@@ -0,0 +1,162 @@
+from multiprocessing import TimeoutError
+from random import seed
+from statistics import fmean, pvariance
+from time import time
+from src.compactboard import CompactBoard
+from src.searchnode import SearchNode
+from src.spellcast import Spellcast
+from src.topmoves import SWAP_MASK, SCORE
+import src.dictionary as dictionary
+import src.ranking as ranking
+import src.solverpool as solverpool
+import numpy as np
+
+LAST_ROUND = 5
+POLICY_MAX_SWAPS = 1
+
+
+def greedy_move(board: CompactBoard):
+    # The best scoring move with at most one swap. It runs inside a worker
+    # on the full trie, since a board trie costs more to build than it saves
+    # on a single small search.
+    game = board.load_into(Spellcast())
+    game.top_k = 1
+    game.max_swaps = POLICY_MAX_SWAPS
+
+    trie = dictionary.trie
+    stack = [
+        search_seed
+        for unit in game.tile_units()
+        for search_seed in game.search_seeds(trie, *unit)
+    ]
+
+    best_moves = game.search(stack, trie)
+    return best_moves[0] if best_moves else None
+
+
+def rollout(task: tuple):
+    # plays the move and then the greedy policy until the end of the match,
+    # returning the total score of the move and every later round
+    move_index, board, path, swap_count, score, rollout_seed, deadline = task
+    if time() > deadline:
+        return move_index, None
+
+    seed(rollout_seed)
+    board = board.copy()
+    board.apply_move(path, swap_count)
+    total_score = score
+
+    while board.match_round <= LAST_ROUND:
+        packed_move = greedy_move(board)
+        if packed_move is None:
+            board.match_round += 1
+            continue
+
+        total_score += packed_move[SCORE]
+        board.apply_move(packed_move[0], packed_move[SWAP_MASK].bit_count())
+
+    return move_index, total_score
+
+
+def plan(game: Spellcast, moves: list[SearchNode], rollouts: int, time_limit_ms: float, base_seed: int = 0):
+    # Ranks moves by the mean final score of random continuations of the
+    # match, with lower variance breaking ties. Returns (move, mean score,
+    # score variance, rollout count) for every move, best first. Moves the
+    # time ran out on before their first rollout keep their place among the
+    # moves as given, with None for mean and variance, as does the variance
+    # of a move with a single rollout.
+    board = CompactBoard.from_board(game)
+    deadline = time() + time_limit_ms / 1000
+
+    # rollouts are interleaved between moves, so that running out of time
+    # leaves every move with about the same number of them
+    tasks = [
+        (
+            move_index,
+            board,
+            bytes(node.y * board.width + node.x for node in move.chain()),
+            move.swap_count(),
+            move.score(game),
+            base_seed + rollout_index * len(moves) + move_index,
+            deadline
+        )
+        for rollout_index in range(rollouts)
+        for move_index, move in enumerate(moves)
+    ]
+
+    final_scores = [[] for _ in moves]
+    results = solverpool.get_pool().imap_unordered(rollout, tasks)
+
+    for _ in tasks:
+        try:
+            move_index, final_score = results.next(max(0, deadline - time()))
+        except TimeoutError:
+            # queued rollouts see the deadline has passed and return at once
+            break
+
+        if final_score is not None:
+            final_scores[move_index].append(final_score)
+
+    planned_ranking = sorted(
+        (
+            (move, fmean(move_scores), pvariance(move_scores) if len(move_scores) > 1 else None, len(move_scores))
+            for move, move_scores in zip(moves, final_scores)
+            if move_scores
+        ),
+        key=lambda ranked_move: (-ranked_move[1], float("inf") if ranked_move[2] is None else ranked_move[2])
+    )
+
+    # moves with rollouts are sorted into the places they held between them
+    planned_moves = iter(planned_ranking)
+    return [
+        next(planned_moves) if move_scores else (move, None, None, 0)
+        for move, move_scores in zip(moves, final_scores)
+    ]
+
+
+class LookaheadRanking(ranking.Ranking):
+    # Another ranking with its first `moves` moves re-ranked by plan().
+    # stats holds (mean score, score variance, rollout count) of those
+    # moves in their new order, for showing alongside them, with None for
+    # what plan() had too few rollouts for. time_limit_ms
+    # covers every order() call together, from the first one on: with
+    # `plans` orderings to come, each gets an even share of the time left.
+    base_ranking: ranking.Ranking
+    moves: int
+    rollouts: int
+    time_limit_ms: float
+    base_seed: int
+    plans_left: int
+    deadline: float | None
+    stats: list[tuple]
+
+    def __init__(self, base_ranking: ranking.Ranking, moves: int, rollouts: int, time_limit_ms: float, base_seed: int = 0, plans: int = 1):
+        super().__init__(base_ranking.limit)
+        self.base_ranking = base_ranking
+        self.moves = moves
+        self.rollouts = rollouts
+        self.time_limit_ms = time_limit_ms
+        self.base_seed = base_seed
+        self.plans_left = plans
+        self.deadline = None
+        self.stats = []
+
+
+    def order(self, context: Spellcast, moves: ranking.MoveArrays):
+        order = self.base_ranking.order(context, moves)
+        planned_indices = order[:self.moves]
+
+        planned_moves = [SearchNode.from_packed(context, moves.move_set.packed(index)) for index in planned_indices]
+        move_indices = {id(move): index for move, index in zip(planned_moves, planned_indices)}
+
+        if self.deadline is None:
+            self.deadline = time() + self.time_limit_ms / 1000
+
+        time_limit_ms = max(0, self.deadline - time()) * 1000 / max(1, self.plans_left)
+        self.plans_left -= 1
+
+        planned_ranking = plan(context, planned_moves, self.rollouts, time_limit_ms, self.base_seed)
+        self.stats = [(mean, variance, rollout_count) for _, mean, variance, rollout_count in planned_ranking]
+
+        replanned_indices = np.array([move_indices[id(move)] for move, _, _, _ in planned_ranking], dtype=order.dtype)
+        return np.concatenate((replanned_indices, order[self.moves:]))
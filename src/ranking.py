@@ -0,0 +1,134 @@
+from abc import ABC, abstractmethod
+import numpy as np
+from src.gems import AVERAGE_SCORES, GEM_VALUE_LOOKUP
+from src.moveset import MoveSet
+
+AVERAGE_SCORE_TABLE = np.array(AVERAGE_SCORES, dtype=np.float64)
+GEM_VALUE_TABLE = np.array(GEM_VALUE_LOOKUP, dtype=np.float64)
+MAX_GEMS = 10
+
+
+class MoveArrays:
+    # The columns of a MoveSet that ranking looks at, as NumPy arrays in the
+    # set's order, so moves can be scored and ordered all at once rather
+    # than through a Python call per move or per comparison.
+    move_set: MoveSet
+    scores: np.ndarray
+    gem_counts: np.ndarray
+    swap_counts: np.ndarray
+    word_ids: np.ndarray
+
+    def __init__(self, move_set: MoveSet):
+        rows = column_array(move_set.order)
+
+        self.move_set = move_set
+        self.scores = column_array(move_set.scores)[rows].astype(np.int32)
+        self.gem_counts = column_array(move_set.gem_counts)[rows].astype(np.int32)
+        self.word_ids = column_array(move_set.word_ids)[rows]
+
+        # popcount of the swap masks, which are under 32 bits wide
+        swap_masks = column_array(move_set.swap_masks)[rows]
+        bytes_per_mask = np.unpackbits(swap_masks.astype("<u4").view(np.uint8).reshape(-1, 4), axis=1)
+        self.swap_counts = bytes_per_mask.sum(axis=1, dtype=np.int32)
+
+
+    def __len__(self):
+        return len(self.scores)
+
+
+def column_array(column):
+    # copies, so the column's buffer isn't held and it can still be extended
+    return np.array(column, dtype=np.dtype(column.typecode))
+
+
+def long_term_scores(context, moves: MoveArrays):
+    # SearchNode.estimated_long_term_score for every move, adding the same
+    # terms in the same order so the results match it exactly
+    final_gem_counts = np.minimum(MAX_GEMS, context.gems + moves.gem_counts - moves.swap_counts * 3)
+    final_gem_counts = np.maximum(final_gem_counts, 0)
+
+    long_term_scores = moves.scores.astype(np.float64)
+
+    if context.match_round < 5:
+        long_term_scores += AVERAGE_SCORE_TABLE[final_gem_counts // 3]
+
+    if context.match_round < 4:
+        long_term_scores += GEM_VALUE_TABLE[np.minimum(final_gem_counts, len(GEM_VALUE_TABLE) - 1)]
+
+    return long_term_scores
+
+
+def best_per_word(moves: MoveArrays, by_swaps: bool = False):
+    # Indices of the highest scoring move of every word, or of every word
+    # and swap count, the earliest one winning ties. They come back in the
+    # order each word first appears, like Spellcast.prune_moves always kept.
+    if len(moves) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    positions = np.arange(len(moves))
+    group_keys = (moves.word_ids, moves.swap_counts) if by_swaps else (moves.word_ids,)
+
+    # word (and swap count), then highest score, then earliest
+    order = np.lexsort((positions, -moves.scores) + group_keys[::-1])
+
+    group_starts = np.ones(len(order), dtype=bool)
+    group_starts[1:] = False
+    for group_key in group_keys:
+        sorted_key = group_key[order]
+        group_starts[1:] |= sorted_key[1:] != sorted_key[:-1]
+
+    best = order[group_starts]
+
+    # each group's first appearance is its smallest position
+    first_positions = np.minimum.reduceat(positions[order], np.flatnonzero(group_starts))
+    return best[np.argsort(first_positions, kind="stable")]
+
+
+def top_scores(moves: MoveArrays, top_k: int):
+    # heapq.nlargest by score, ties going to the earliest move
+    return np.argsort(-moves.scores, kind="stable")[:top_k]
+
+
+class Ranking(ABC):
+    # A way of ordering moves, best first. Subclasses implement order(),
+    # which returns indices into the moves and may be handed the moves of
+    # any board. limit caps how many
+    # ranked moves are turned back into SearchNodes.
+    limit: int | None
+
+    def __init__(self, limit: int | None = None):
+        self.limit = limit
+
+
+    @abstractmethod
+    def order(self, context, moves: MoveArrays) -> np.ndarray:
+        pass
+
+
+class ScoreRanking(Ranking):
+    # by the score of the move itself
+    def order(self, context, moves: MoveArrays):
+        return np.argsort(-moves.scores, kind="stable")
+
+
+class GemRanking(Ranking):
+    # by the score of the move plus what the gems it leaves are worth for
+    # the rest of the match, then by the gems it collects
+    def order(self, context, moves: MoveArrays):
+        return np.lexsort((-moves.gem_counts, -long_term_scores(context, moves)))
+
+
+def rank(context, move_set: MoveSet, ranking: Ranking, top_k: int | None = None):
+    # the moves in ranked order, after keeping only the top_k highest
+    # scoring ones if top_k is set
+    moves = MoveArrays(move_set)
+
+    if top_k is not None:
+        move_set = move_set.take(top_scores(moves, top_k))
+        moves = MoveArrays(move_set)
+
+    order = ranking.order(context, moves)
+    if ranking.limit is not None:
+        order = order[:ranking.limit]
+
+    return move_set.take(order, context)
@@ -1,97 +1,157 @@
 from typing_extensions import Self
 from json import load
-from src.tile import Tile, TileModifier
+from src.tile import Tile, TileModifier, BOARD_SIZE
 from src.gems import AVERAGE_SCORES, gem_value
 
 config = load(open("config.json"))
 
 
 class SearchNode(Tile):
+    # Everything the accessors need is carried over from the parent when the
+    # node is created, so word(), score(), gem_count() and swap_count() never
+    # have to walk the chain.
+    __slots__ = (
+        "parent", "swap", "visited",
+        "_word", "_length", "_letter_score", "_double_word", "_gem_count", "_swap_count"
+    )
+
     parent: Self | None
 
     letter: str
     swap: bool
+    visited: int
     
 
-    def __init__(self, parent: Self, tile: Tile, swap: bool = False):
-        super().__init__(tile.letter, tile.x, tile.y)
+    def __init__(self, parent: Self, tile: Tile, swap: bool = False, letter: str = None):
+        self.letter = tile.letter if letter is None else letter
         self.modifiers = tile.modifiers
+        self.x = tile.x
+        self.y = tile.y
 
         self.parent = parent
         self.swap = swap
 
-        self._word = None
-        self._score = None
-        self._gem_count = None
-        self._swap_count = None
+        tile_bit = 1 << (tile.y * BOARD_SIZE + tile.x)
+        double_word = TileModifier.DOUBLE_WORD in self.modifiers
+        gem = TileModifier.GEM in self.modifiers
+
+        if parent is None:
+            self.visited = tile_bit
+            self._word = self.letter
+            self._length = 1
+            self._letter_score = self.value()
+            self._double_word = double_word
+            self._gem_count = int(gem)
+            self._swap_count = int(swap)
+        else:
+            self.visited = parent.visited | tile_bit
+            self._word = parent._word + self.letter
+            self._length = parent._length + 1
+            self._letter_score = parent._letter_score + self.value()
+            self._double_word = parent._double_word or double_word
+            self._gem_count = parent._gem_count + gem
+            self._swap_count = parent._swap_count + swap
+
+
+    def from_packed(context, packed_move: tuple):
+        path, swap_mask, swap_letters = packed_move[:3]
+        swapped_letters = iter(swap_letters)
+
+        node = None
+        for tile_index in path:
+            tile = context.tile_at(tile_index % BOARD_SIZE, tile_index // BOARD_SIZE)
+
+            if swap_mask & (1 << tile_index):
+                node = SearchNode(node, tile, True, next(swapped_letters))
+            else:
+                node = SearchNode(node, tile)
+
+        return node
+
+
+    def pack(self, context, word_id: int):
+        # (tile indices along the path, bitmask of swapped tile indices,
+        #  swapped letters in path order, score, gem count, word id,
+        #  bitmask of tile indices along the path)
+        path = bytearray()
+        swap_mask = 0
+        swap_letters = ""
+        tile_mask = 0
+
+        for chain_node in self.chain():
+            tile_index = chain_node.y * BOARD_SIZE + chain_node.x
+            path.append(tile_index)
+            tile_mask |= 1 << tile_index
+
+            if chain_node.swap:
+                swap_mask |= 1 << tile_index
+                swap_letters += chain_node.letter
+
+        return (bytes(path), swap_mask, swap_letters, self.score(context), self.gem_count(), word_id, tile_mask)
 
 
     def to_string(self, context = None):
         swap_strings = {}
-        for chain_node in self.chain():
-            if not chain_node.swap:
-                continue
-            swap_strings[(chain_node.x + 1, chain_node.y + 1)] = chain_node.letter.upper()
+        coordinates = []
 
-        coordinates = [(chain_node.x + 1, chain_node.y + 1) for chain_node in self.chain()]
+        for chain_node in self.chain():
+            coordinates.append((chain_node.x + 1, chain_node.y + 1))
+            if chain_node.swap:
+                swap_strings[(chain_node.x + 1, chain_node.y + 1)] = chain_node.letter.upper()
 
         return self.word(), self.score(context), self.gem_count(), coordinates, swap_strings
 
 
     def chain(self):
-        nodes: list[Self] = [self]
+        nodes: list[Self] = []
 
-        while nodes[0].parent is not None:
-            nodes.insert(0, nodes[0].parent)
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
 
+        nodes.reverse()
         return nodes
     
 
     def chain_contains(self, x: int, y: int):
-        for chain_node in self.chain():
-            if chain_node.x == x and chain_node.y == y:
-                return True
-            
-        return False
+        return bool(self.visited & (1 << (y * BOARD_SIZE + x)))
     
 
     def word(self):
-        if self._word is None:
-            self._word = "".join([chain_node.letter for chain_node in self.chain()])
         return self._word
     
 
     def score(self, context=None):
-        if self._score is None:
-            score = 0
-            double_word_score = False
-            gem_count = 0
-            word_length = 0
+        score = self._letter_score
+
+        if self._double_word:
+            score *= 2
+
+        if self._length >= 6:
+            score += 10
 
-            chain = self.chain()
-            for chain_node in chain:
-                score += chain_node.value()
-                word_length += 1
+        if context is not None and context.match_round == 5:
+            score += self._gem_count
 
-                if TileModifier.DOUBLE_WORD in chain_node.modifiers:
-                    double_word_score = True
+        return score
 
-                if TileModifier.GEM in chain_node.modifiers:
-                    gem_count += 1
 
-            if double_word_score:
-                score *= 2
+    def score_bound(self, context, extra_letter_score: int, extra_length: int, double_word_possible: bool):
+        # highest score any word extending this node by up to extra_length
+        # letters worth at most extra_letter_score in total could reach
+        score = self._letter_score + extra_letter_score
 
-            if word_length >= 6:
-                score += 10
+        if self._double_word or double_word_possible:
+            score *= 2
 
-            if context is not None and context.match_round == 5:
-                score += gem_count
+        if self._length + extra_length >= 6:
+            score += 10
 
-            self._score = score
-            self._gem_count = gem_count  # Cache gem_count for future use
+        if context is not None and context.match_round == 5:
+            score += self._gem_count + extra_length
 
-        return self._score
+        return score
 
 
     def estimated_long_term_score(self, context):
@@ -113,12 +173,8 @@ class SearchNode(Tile):
 
 
     def gem_count(self):
-        if self._gem_count is None:
-            self._gem_count = sum(TileModifier.GEM in chain_node.modifiers for chain_node in self.chain())
         return self._gem_count
 
 
     def swap_count(self):
-        if self._swap_count is None:
-            self._swap_count = sum(chain_node.swap for chain_node in self.chain())
         return self._swap_count
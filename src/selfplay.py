@@ -0,0 +1,218 @@
+from argparse import ArgumentParser
+from json import dump, dumps, loads
+from random import seed
+from statistics import fmean
+from time import perf_counter
+from src.compactboard import CompactBoard
+from src.searchnode import SearchNode
+from src.spellcast import Spellcast
+from src.gems import GEM_TABLES_PATH, get_gem_value
+import src.solverpool as solverpool
+import os
+
+LAST_ROUND = 5
+MAX_GEMS = 10
+TABLE_SWAPS = 3
+
+STATS_PATH = "selfplay.jsonl"
+REPORT_INTERVAL = 10
+
+
+def game_seed(base_seed: int, game_number: int):
+    # every game has a seed of its own, so a game plays out the same no
+    # matter which worker runs it or how many games came before it
+    return f"{base_seed}:{game_number}"
+
+
+def play_game(task: tuple):
+    # Plays a random match from the first round to the last, always taking
+    # the best scoring move the gems held can pay for. Every round records
+    # the best move for each swap budget up to max_swaps as well, which is
+    # what the gem tables are averaged from. The word length and score
+    # floors the app suggests moves with are turned off, so a round only
+    # records no move when the board really has none, rather than a 0 for
+    # every round without a long, high scoring word dragging the averages
+    # down.
+    game_number, base_seed, max_swaps, start_gems = task
+    start_time = perf_counter()
+
+    seed(game_seed(base_seed, game_number))
+    board = CompactBoard.random(5, 5)
+    board.gems = start_gems
+
+    rounds = []
+    total_score = 0
+
+    while board.match_round <= LAST_ROUND:
+        round_start_time = perf_counter()
+
+        game = board.load_into(Spellcast())
+        game.in_worker = True
+        game.min_word_length = 1
+        game.min_score = 0
+        moves_by_swaps = game.legal_moves_by_swaps(max_swaps, SearchNode.score, top_k=1)
+        best_moves = [moves[0] if moves else None for moves in moves_by_swaps]
+
+        move = best_moves[min(board.gems // 3, max_swaps)]
+        round_stats = {
+            "round": board.match_round,
+            "gems": board.gems,
+            # without the last round's gem bonus, so every round averages alike
+            "bestScores": [0 if best_move is None else best_move.score() for best_move in best_moves],
+            "netGemProfits": [0 if best_move is None else best_move.net_gem_profit() for best_move in best_moves],
+            "word": None if move is None else move.word(),
+            "score": 0 if move is None else move.score(game),
+            "swaps": 0 if move is None else move.swap_count()
+        }
+
+        if move is None:
+            board.match_round += 1
+        else:
+            total_score += round_stats["score"]
+            board.play_move(move)
+            board.gems = min(board.gems, MAX_GEMS)
+
+        round_stats["seconds"] = round(perf_counter() - round_start_time, 3)
+        rounds.append(round_stats)
+
+    return {
+        "game": game_number,
+        "seed": game_seed(base_seed, game_number),
+        "maxSwaps": max_swaps,
+        "startGems": start_gems,
+        "totalScore": total_score,
+        "finalGems": board.gems,
+        "seconds": round(perf_counter() - start_time, 3),
+        "rounds": rounds
+    }
+
+
+def load_games(stats_path: str):
+    # The stats file doubles as the checkpoint, one line per finished game.
+    # A line cut off by an interrupted run is dropped so the file can be
+    # appended to again.
+    if not os.path.exists(stats_path):
+        return []
+
+    with open(stats_path, "rb") as file:
+        contents = file.read()
+
+    games = []
+    valid_length = 0
+    for line in contents.split(b"\n")[:-1]:
+        try:
+            games.append(loads(line))
+        except ValueError:
+            break
+        valid_length += len(line) + 1
+
+    if valid_length < len(contents):
+        with open(stats_path, "rb+") as file:
+            file.truncate(valid_length)
+
+    return games
+
+
+def play(game_count: int, base_seed: int = 0, stats_path: str = STATS_PATH, max_swaps: int = TABLE_SWAPS, start_gems: int = 0):
+    # Plays game_count games across the solver pool, streaming each finished
+    # game to stats_path. Games already in the file are skipped, so a run
+    # that was stopped carries on where it left off. That only holds for a
+    # file played with the same seed, max_swaps and start_gems, anything
+    # else is refused rather than mixed in.
+    games = load_games(stats_path)
+
+    for game in games:
+        expected = (game_seed(base_seed, game["game"]), max_swaps, start_gems)
+        if (game["seed"], game.get("maxSwaps"), game.get("startGems")) != expected:
+            raise ValueError(f"{stats_path} was played with a different seed, max swaps or start gems, use another stats file")
+
+    finished_games = {game["game"] for game in games}
+    tasks = [
+        (game_number, base_seed, max_swaps, start_gems)
+        for game_number in range(game_count)
+        if game_number not in finished_games
+    ]
+
+    if finished_games:
+        print(f"resuming, {len(finished_games)} of {game_count} games already played")
+
+    start_time = perf_counter()
+    played = 0
+
+    with open(stats_path, "a") as file:
+        for game in solverpool.get_pool().imap_unordered(play_game, tasks):
+            file.write(dumps(game) + "\n")
+            file.flush()
+            played += 1
+
+            if played % REPORT_INTERVAL == 0 or played == len(tasks):
+                games_per_second = played / (perf_counter() - start_time)
+                print(f"{len(finished_games) + played}/{game_count} games, {games_per_second:.2f} games/sec")
+
+    return played, perf_counter() - start_time
+
+
+def gem_tables(games: list[dict]):
+    # averages the best score and net gem profit of every swap budget over
+    # every round played, and the gem values that follow from them
+    rounds = [round_stats for game in games for round_stats in game["rounds"]]
+    if not rounds:
+        raise ValueError("no self-play rounds to build the gem tables from")
+
+    if any(len(round_stats["bestScores"]) <= TABLE_SWAPS for round_stats in rounds):
+        raise ValueError(f"the gem tables need games played with up to {TABLE_SWAPS} swaps")
+
+    average_scores = [
+        round(fmean(round_stats["bestScores"][swap_count] for round_stats in rounds), 1)
+        for swap_count in range(TABLE_SWAPS + 1)
+    ]
+    average_net_gem_profits = [
+        round(fmean(round_stats["netGemProfits"][swap_count] for round_stats in rounds), 1)
+        for swap_count in range(TABLE_SWAPS + 1)
+    ]
+
+    return {
+        "averageScores": average_scores,
+        "averageNetGemProfits": average_net_gem_profits,
+        "gemValueLookup": [get_gem_value(gem_count, average_scores) for gem_count in range(MAX_GEMS + 1)],
+        "games": len(games),
+        "rounds": len(rounds)
+    }
+
+
+def write_gem_tables(stats_path: str = STATS_PATH, tables_path: str = GEM_TABLES_PATH):
+    tables = gem_tables(load_games(stats_path))
+
+    with open(tables_path, "w") as file:
+        dump(tables, file, indent=4)
+
+    return tables
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="play random matches to recalibrate the gem tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    play_parser = commands.add_parser("play", help="play games and stream their statistics to disk")
+    play_parser.add_argument("games", type=int)
+    play_parser.add_argument("--seed", type=int, default=0)
+    play_parser.add_argument("--stats", default=STATS_PATH)
+    play_parser.add_argument("--max-swaps", type=int, default=TABLE_SWAPS)
+    play_parser.add_argument("--start-gems", type=int, default=0)
+
+    tables_parser = commands.add_parser("tables", help=f"regenerate {GEM_TABLES_PATH} from played games")
+    tables_parser.add_argument("--stats", default=STATS_PATH)
+    tables_parser.add_argument("--out", default=GEM_TABLES_PATH)
+
+    arguments = parser.parse_args()
+
+    if arguments.command == "play":
+        played, seconds = play(arguments.games, arguments.seed, arguments.stats, arguments.max_swaps, arguments.start_gems)
+        games_per_second = played / seconds if seconds else 0
+        print(f"played {played} games in {seconds:.1f}s, {games_per_second:.2f} games/sec")
+    else:
+        tables = write_gem_tables(arguments.stats, arguments.out)
+        print(f"averaged {tables['rounds']} rounds of {tables['games']} games into {arguments.out}")
+        print(f"AVERAGE_SCORES = {tables['averageScores']}")
+        print(f"AVERAGE_NET_GEM_PROFITS = {tables['averageNetGemProfits']}")
+        print(f"GEM_VALUE_LOOKUP = {tables['gemValueLookup']}")
@@ -0,0 +1,31 @@
+from src.lrucache import LRUCache
+import src.dictionary as dictionary
+
+# bumped whenever the layout of the cached moves changes
+CACHE_VERSION = 2
+
+
+class SolveCache(LRUCache):
+    # Least recently used cache of solve results keyed by board fingerprint,
+    # optionally mirrored to a file so results survive a restart. Word ids are
+    # trie node indices, so a saved cache is only reused while the dictionary
+    # it was built with is unchanged. Puts only mark the cache as changed,
+    # save_changes() writes it out.
+    name = "solve cache"
+    entry_name = "boards"
+    changed: bool
+
+    def __init__(self, max_size: int = 64, path: str | None = None):
+        super().__init__(max_size, path, (CACHE_VERSION, dictionary.source_stamp()))
+        self.changed = False
+
+
+    def put(self, key: str, entry):
+        super().put(key, entry)
+        self.changed = self.changed or self.max_size > 0
+
+
+    def save_changes(self):
+        if self.changed:
+            self.save()
+            self.changed = False
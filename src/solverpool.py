@@ -0,0 +1,80 @@
+from multiprocessing import Array, Pool, RawValue
+import src.dictionary as dictionary
+import atexit, os
+
+solver_pool = None
+# shared with every worker, bumped to cancel the units of earlier solves
+solve_generation = None
+# the k-th best score any unit of the current solve has found, for every
+# number of swaps, so units prune against each other's moves
+solve_floors = None
+FLOOR_SLOTS = 8
+
+
+def init_worker(generation, floors):
+    global solve_generation, solve_floors
+    solve_generation = generation
+    solve_floors = floors
+
+    # fault the mapped dictionary into memory before the first task arrives
+    dictionary.warm()
+
+
+def get_pool():
+    global solver_pool, solve_generation, solve_floors
+    if solver_pool is None:
+        solve_generation = RawValue("q", 0)
+        solve_floors = Array("q", FLOOR_SLOTS)
+        solver_pool = Pool(processes=os.cpu_count(), initializer=init_worker, initargs=(solve_generation, solve_floors))
+
+    return solver_pool
+
+
+def new_generation():
+    # a generation for the units of a new solve, cancelling any still
+    # queued or running from the one before
+    get_pool()
+    with solve_floors.get_lock():
+        solve_generation.value += 1
+        solve_floors[:] = [-1] * FLOOR_SLOTS
+
+    return solve_generation.value
+
+
+def exchange_floors(generation: int, floors: list[int]):
+    # Raises the solve's floors to the given ones and returns them. The
+    # lock keeps a unit of a cancelled solve from raising the floors of
+    # the next one.
+    with solve_floors.get_lock():
+        if solve_generation.value != generation:
+            return floors
+
+        shared_floors = solve_floors.get_obj()
+        for swaps, floor in enumerate(floors[:FLOOR_SLOTS]):
+            if floor > shared_floors[swaps]:
+                shared_floors[swaps] = floor
+
+        return shared_floors[:len(floors)]
+
+
+def cancel(generation: int):
+    if solve_generation is not None and solve_generation.value == generation:
+        solve_generation.value += 1
+
+
+def is_cancelled(generation: int | None):
+    # units run outside the pool have no generation and are never cancelled
+    return generation is not None and solve_generation is not None and solve_generation.value != generation
+
+
+def shutdown_pool():
+    global solver_pool
+    if solver_pool is None:
+        return
+
+    solver_pool.close()
+    solver_pool.join()
+    solver_pool = None
+
+
+atexit.register(shutdown_pool)
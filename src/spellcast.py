@@ -1,112 +1,1027 @@
-from src.board import Board
-from src.tile import TileModifier, Tile
+from src.board import Board, BoardTiles
+from src.tile import TileModifier, Tile, BOARD_SIZE, letter_values
 from src.searchnode import SearchNode
+from src.topmoves import TopMoves, SwapTopMoves
 from src.gems import AVERAGE_SCORES, AVERAGE_NET_GEM_PROFITS, gem_value
+from src.solvecache import SolveCache
+from src.moveset import MoveSet
 import src.dictionary as dictionary
-from functools import lru_cache
-from multiprocessing import Pool
-import os
+import src.boardtrie as boardtrie
+import src.ranking as ranking
+import src.solverpool as solverpool
+from array import array
+from copy import copy
+from json import load
+from multiprocessing import TimeoutError
+from time import perf_counter, time
+import numpy as np
+import atexit, os
 
-@lru_cache(maxsize=None)
-def cached_has_word(word):
-    return dictionary.has_word(word)
+config = load(open("config.json"))
+
+MAX_WORD_LENGTH = 15
+MIN_WORD_LENGTH = 5
+MIN_SCORE = 15
+
+# how long a solve waits past its deadline for the units still running to
+# hand in what they found before it
+CANCEL_GRACE_SECONDS = 0.1
+
+# the most moves kept indexed between solves for incremental re-solving,
+# around 15MB, past which the next solve is a full one instead. It also
+# caps the moves a solve holds, past it only the best move of every word is
+# kept as the units hand in their moves.
+MAX_INDEXED_MOVES = 250_000
+
+FULL_BOARD_MASK = (1 << BOARD_SIZE * BOARD_SIZE) - 1
+LEFT_COLUMN_MASK = sum(1 << (row * BOARD_SIZE) for row in range(BOARD_SIZE))
+RIGHT_COLUMN_MASK = LEFT_COLUMN_MASK << (BOARD_SIZE - 1)
+
+max_value_letter = max(letter_values, key=letter_values.get)
+# a triple letter tile adds at most twice the value of the letter on it
+MAX_LETTER_BOOST = 2
+
+solve_cache: SolveCache | None = None
+
+
+def get_solve_cache():
+    # created on first use rather than on import, so pool workers, which
+    # import this module too but never use the cache, don't load the saved
+    # cache. It's written back once when the process exits rather than
+    # after every solve.
+    global solve_cache
+    if solve_cache is None:
+        solve_cache = SolveCache(config["solveCacheSize"], config["solveCachePath"] or None)
+        atexit.register(solve_cache.save_changes)
+
+    return solve_cache
+
+
+def king_dilation(tile_mask: int):
+    # every tile in tile_mask plus every tile one king move away from one
+    horizontal = tile_mask | ((tile_mask & ~RIGHT_COLUMN_MASK) << 1) | ((tile_mask & ~LEFT_COLUMN_MASK) >> 1)
+    return (horizontal | (horizontal << BOARD_SIZE) | (horizontal >> BOARD_SIZE)) & FULL_BOARD_MASK
 
-@lru_cache(maxsize=None)
-def cached_has_prefix(prefix):
-    return dictionary.has_prefix(prefix)
 
 class Spellcast(Board):
-    def legal_moves_from(self, x: int, y: int):
-        legal_move_nodes = []
-        stack = [(SearchNode(None, self.tile_at(x, y)), self.tile_at(x, y).letter, {(x, y)})]
-        
-        max_depth = 15
-        min_word_length = 5
-        min_score_threshold = 15
-        
+    task_timings: list
+    solve_seconds: float = 0
+    top_k: int | None = None
+    max_swaps: int | None = None
+    deadline: float | None = None
+    generation: int | None = None
+    search_complete: bool = True
+    cache_hit: bool = False
+    move_index: dict | None = None
+    indexed_moves: MoveSet | None = None
+    indexed_state: tuple | None = None
+    changed_mask: int = 0
+    change_distances: list | None = None
+    changed_tile_count: int | None = None
+    engine: str = "tiles"
+    neighbours: list | None = None
+    board_bounds: tuple | None = None
+    unit_floors: list | None = None
+    split_swaps: bool = False
+    in_worker: bool = False
+    peak_move_bytes: int = 0
+    moves_pruned: bool = False
+    # the shortest word and lowest score worth suggesting
+    min_word_length: int = MIN_WORD_LENGTH
+    min_score: int = MIN_SCORE
+
+
+    def __init__(self, tiles: BoardTiles = [], gems: int = 0):
+        super().__init__(tiles, gems)
+        self.task_timings = []
+
+
+    def __getstate__(self):
+        # workers only need the board, not the moves indexed by earlier
+        # solves or the timings of the units already run
+        state = self.__dict__.copy()
+        state.pop("move_index", None)
+        state.pop("indexed_moves", None)
+        state.pop("indexed_state", None)
+        state["task_timings"] = []
+        return state
+
+
+    def legal_moves_from(self, x: int, y: int, step_x: int, step_y: int, swap: bool = False):
+        trie = self.search_trie()
+        return self.search(self.search_seeds(trie, x, y, step_x, step_y, swap), trie)
+
+
+    def search_seeds(self, trie: dictionary.Trie, x: int, y: int, step_x: int, step_y: int, swap: bool = False):
+        start_tile = self.tile_at(x, y)
+        start_cursor = trie.child(dictionary.ROOT, start_tile.letter)
+        if start_cursor is None:
+            return []
+
+        start_node = SearchNode(None, start_tile)
+        step_tile = self.tile_at(step_x, step_y)
+
+        if swap:
+            steps = self.swap_steps(trie, start_node, start_cursor, step_tile)
+        else:
+            step_cursor = trie.child(start_cursor, step_tile.letter)
+            steps = [] if step_cursor is None else [(SearchNode(start_node, step_tile), step_cursor)]
+
+        return [(node, cursor, 2) for node, cursor in steps]
+
+
+    def search_trie(self):
+        # only the words this board can spell with the swaps it has left
+        return boardtrie.board_trie(self.board_letters(), self.swap_budget())
+
+
+    def swap_steps(self, trie: dictionary.Trie, current_node: SearchNode, cursor: int, adjacent_tile: Tile):
+        for swap_letter, swap_cursor in trie.children(cursor):
+            if swap_letter != adjacent_tile.letter:
+                yield SearchNode(current_node, adjacent_tile, True, swap_letter), swap_cursor
+
+
+    def swap_budget(self):
+        if self.max_swaps is None:
+            return self.gems // 3
+
+        return min(self.gems // 3, self.max_swaps)
+
+
+    def bound_masks(self):
+        # bitmask of the double word tiles, and the most the letter
+        # multiplier of every tile could add to its letter, by tile index
+        double_word_mask = 0
+        tile_boosts = []
+
+        for tile_index, tile in enumerate(self.grid_tiles()):
+            if TileModifier.DOUBLE_WORD in tile.modifiers:
+                double_word_mask |= 1 << tile_index
+
+            boosted_tile = Tile(max_value_letter, tile.x, tile.y)
+            boosted_tile.modifiers = tile.modifiers
+            tile_boosts.append(max(0, boosted_tile.value() - letter_values[max_value_letter]))
+
+        return double_word_mask, tile_boosts
+
+
+    @staticmethod
+    def visited_boost(tile_boosts: list[int], visited: int):
+        # the letter multiplier boosts of the tiles in the visited bitmask
+        boost = 0
+        while visited:
+            tile_bit = visited & -visited
+            boost += tile_boosts[tile_bit.bit_length() - 1]
+            visited ^= tile_bit
+
+        return boost
+
+
+    def usable_neighbours(self, tile: Tile):
+        for adjacent_tile in self.adjacent_tiles(tile.x, tile.y):
+            if adjacent_tile.x >= BOARD_SIZE or adjacent_tile.y >= BOARD_SIZE:
+                continue
+
+            if TileModifier.FROZEN not in adjacent_tile.modifiers:
+                yield adjacent_tile
+
+
+    def neighbour_table(self):
+        # (tile bit, tile, letter bit, letter boost) of the usable neighbours
+        # of every tile index, so the search never has to bounds check or
+        # look tiles up
+        _, tile_boosts = self.bound_masks()
+        neighbour_table = []
+
+        for tile in self.grid_tiles():
+            neighbours = []
+            neighbour_table.append(neighbours)
+
+            for adjacent_tile in self.usable_neighbours(tile):
+                letter_index = dictionary.letter_indices.get(adjacent_tile.letter)
+                adjacent_index = adjacent_tile.y * BOARD_SIZE + adjacent_tile.x
+                neighbours.append((
+                    1 << adjacent_index,
+                    adjacent_tile,
+                    0 if letter_index is None else 1 << letter_index,
+                    tile_boosts[adjacent_index]
+                ))
+
+        return neighbour_table
+
+
+    def new_top_moves(self):
+        if self.top_k is None:
+            return None
+
+        if self.split_swaps:
+            return SwapTopMoves(self.top_k, self.swap_budget())
+
+        return TopMoves(self.top_k)
+
+
+    def exchange_floors(self, top_moves: TopMoves | SwapTopMoves):
+        # Shares the k-th best scores this unit has found with the other
+        # units of the solve and takes theirs, so every unit prunes against
+        # the best moves found anywhere rather than only its own. Units run
+        # in a worker one after another share a list instead of the pool's.
+        own_floors = top_moves.own_floors()
+        if self.generation is not None:
+            top_moves.raise_floors(solverpool.exchange_floors(self.generation, own_floors))
+        elif self.unit_floors is not None:
+            self.unit_floors[:] = map(max, self.unit_floors, own_floors)
+            top_moves.raise_floors(self.unit_floors)
+
+
+    def search(self, stack: list, trie: dictionary.Trie):
+        legal_moves = []
+        top_moves = self.new_top_moves()
+        swap_budget = self.swap_budget()
+        deadline = self.deadline
+        generation = self.generation
+        changed_mask = self.changed_mask
+        change_distances = self.change_distances
+        neighbour_table = self.neighbours if self.neighbours is not None else self.neighbour_table()
+        double_word_mask, tile_boosts = self.board_bounds if self.board_bounds is not None else self.bound_masks()
+        masks = trie.masks
+        first_children = trie.first_children
+        expansions = 0
+        self.search_complete = True
+
+        # every stack entry carries the most the letter multipliers of the
+        # tiles its path hasn't visited could add, for the score bound
+        boost_total = sum(tile_boosts)
+        stack = [
+            (node, cursor, word_length, boost_total - self.visited_boost(tile_boosts, node.visited))
+            for node, cursor, word_length in stack
+        ]
+        score_floors = None if top_moves is None else top_moves.floors(swap_budget)
+
         while stack:
-            current_node, word, visited = stack.pop()
+            if expansions & 255 == 0:
+                # Give up with what has been found so far once the deadline passes
+                if deadline is not None and (time() > deadline or solverpool.is_cancelled(generation)):
+                    self.search_complete = False
+                    break
+
+                if top_moves is not None:
+                    self.exchange_floors(top_moves)
+                    score_floors = top_moves.floors(swap_budget)
+            expansions += 1
+
+            current_node, cursor, word_length, boost_left = stack.pop()
             
-            if len(word) > max_depth:
+            if word_length > MAX_WORD_LENGTH:
                 continue
+
+            remaining_length = min(trie.heights[cursor], MAX_WORD_LENGTH - word_length)
+
+            # When re-searching after a board change, moves that miss every
+            # changed tile are already known, so only paths that can still
+            # reach a changed tile are followed
+            touches_change = not changed_mask or current_node.visited & changed_mask
+            if not touches_change:
+                if change_distances[current_node.y * BOARD_SIZE + current_node.x] > remaining_length:
+                    continue
+
+            # Prune branches that can't beat the current k-th best move
+            if score_floors is not None and score_floors[current_node.swap_count()] >= 0:
+                # whatever letters follow, they spell one of the suffixes
+                # below the cursor, and no more than all of them can land
+                # on boosted tiles
+                suffix_score = trie.suffix_scores[cursor]
+                extra_letter_score = suffix_score + min(boost_left, MAX_LETTER_BOOST * suffix_score)
+
+                score_bound = current_node.score_bound(
+                    self,
+                    extra_letter_score,
+                    remaining_length,
+                    bool(double_word_mask & ~current_node.visited)
+                )
+                if score_bound <= score_floors[current_node.swap_count()]:
+                    continue
             
-            # Early pruning based on word length and score
-            if len(word) >= min_word_length:
-                if cached_has_word(word):
-                    score = self.quick_score_estimate(current_node)
-                    if score >= min_score_threshold:
-                        legal_move_nodes.append(current_node)
+            if touches_change and word_length >= self.min_word_length and trie.is_word(cursor):
+                score = current_node.score(self)
+                if score >= self.min_score:
+                    word_id = trie.word_id(cursor)
+
+                    if top_moves is None:
+                        legal_moves.append(current_node.pack(self, word_id))
+                    elif top_moves.accepts(score, word_id, current_node.swap_count()):
+                        top_moves.add(current_node.pack(self, word_id))
+                        score_floors = top_moves.floors(swap_budget)
+
+            if remaining_length == 0:
+                continue
             
-            for dx, dy in [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]:
-                new_x, new_y = current_node.x + dx, current_node.y + dy
-                if 0 <= new_x < 5 and 0 <= new_y < 5:
-                    adjacent_tile = self.tile_at(new_x, new_y)
-                    if TileModifier.FROZEN in adjacent_tile.modifiers:
+            visited = current_node.visited
+            cursor_mask = masks[cursor]
+            can_swap = current_node.swap_count() < swap_budget
+
+            for tile_bit, adjacent_tile, letter_bit, boost in neighbour_table[current_node.y * BOARD_SIZE + current_node.x]:
+                if visited & tile_bit:
+                    continue
+
+                if cursor_mask & letter_bit:
+                    new_cursor = first_children[cursor] + (cursor_mask & (letter_bit - 1)).bit_count()
+                    stack.append((SearchNode(current_node, adjacent_tile), new_cursor, word_length + 1, boost_left - boost))
+
+                # Handle swaps
+                if can_swap:
+                    for swap_node, swap_cursor in self.swap_steps(trie, current_node, cursor, adjacent_tile):
+                        stack.append((swap_node, swap_cursor, word_length + 1, boost_left - boost))
+
+        if top_moves is None:
+            return legal_moves
+
+        self.exchange_floors(top_moves)
+        return top_moves.sorted()
+
+
+    def board_letters(self):
+        return "".join(sorted(
+            tile.letter
+            for tile in self.grid_tiles()
+            if TileModifier.FROZEN not in tile.modifiers
+        ))
+
+
+    def candidate_words(self):
+        return boardtrie.board_words(
+            self.board_letters(), self.swap_budget(), self.min_word_length, MAX_WORD_LENGTH
+        )
+
+
+    def word_masks(self):
+        # bitmask of the usable tiles, of the usable tiles holding each
+        # letter and of the usable neighbours of every tile
+        usable_mask = 0
+        letter_masks = {}
+
+        for tile_index, tile in enumerate(self.grid_tiles()):
+            if TileModifier.FROZEN in tile.modifiers:
+                continue
+
+            tile_bit = 1 << tile_index
+            usable_mask |= tile_bit
+            letter_masks[tile.letter] = letter_masks.get(tile.letter, 0) | tile_bit
+
+        neighbour_masks = [
+            king_dilation(1 << tile_index) & ~(1 << tile_index) & usable_mask
+            for tile_index in range(BOARD_SIZE * BOARD_SIZE)
+        ]
+
+        return usable_mask, letter_masks, neighbour_masks
+
+
+    def choose_engine(self):
+        # The tile driven search branches 25 ways for every swap it tries,
+        # so once two or more swaps are allowed it's faster to go through
+        # the words the board could spell and look for a path for each
+        if config["searchEngine"] != "auto":
+            return config["searchEngine"]
+
+        return "words" if self.swap_budget() >= 2 else "tiles"
+
+
+    def legal_moves_for_words(self, first_letter: str):
+        legal_moves = []
+        top_moves = self.new_top_moves()
+        swap_budget = self.swap_budget()
+        deadline = self.deadline
+        generation = self.generation
+        changed_mask = self.changed_mask
+        self.search_complete = True
+
+        usable_mask, letter_masks, neighbour_masks = self.word_masks()
+        board_tiles = self.grid_tiles()
+
+        double_word_mask, tile_boosts = self.bound_masks()
+        boost_bound = sum(tile_boosts)
+        last_round = self.match_round == 5
+        score_floors = None if top_moves is None else top_moves.floors(swap_budget)
+
+        candidate_words = self.candidate_words().get(first_letter, [])
+        word_bounds = {}
+
+        if top_moves is not None:
+            # with top_k set, words are tried from the highest score they
+            # could reach down, so the k-th best move rises early and the
+            # search can stop at the first word that couldn't get in
+            for word, word_id in candidate_words:
+                score_bound = sum(letter_values[letter] for letter in word) + boost_bound
+                if double_word_mask:
+                    score_bound *= 2
+                if len(word) >= 6:
+                    score_bound += 10
+                if last_round:
+                    score_bound += len(word)
+
+                word_bounds[word_id] = score_bound
+
+            candidate_words = sorted(candidate_words, key=lambda entry: word_bounds[entry[1]], reverse=True)
+
+        for word_index, (word, word_id) in enumerate(candidate_words):
+            # Give up with what has been found so far once the deadline passes,
+            # a single word with a few swaps to try can take milliseconds
+            if deadline is not None and (time() > deadline or solverpool.is_cancelled(generation)):
+                self.search_complete = False
+                break
+
+            if top_moves is not None and word_index & 15 == 0:
+                self.exchange_floors(top_moves)
+                score_floors = top_moves.floors(swap_budget)
+
+            if top_moves is not None and word_bounds[word_id] <= score_floors[0]:
+                break
+
+            # fits[index][swaps] holds the tiles word[index:] could start on
+            # using at most that many swaps, if paths were allowed to cross
+            # themselves. Working backwards means the exact search below
+            # only ever steps onto tiles that can still finish the word.
+            fits = [None] * len(word)
+            reachable = [0] * (swap_budget + 1)
+
+            # When re-searching after a board change, only paths through a
+            # changed tile are new. changed_fits[index][swaps] narrows fits
+            # down to the tiles from which word[index:] can still cross one,
+            # and paths keep to it until they have.
+            changed_fits = [None] * len(word)
+            changed_reachable = [0] * (swap_budget + 1)
+
+            for index in reversed(range(len(word))):
+                matching = letter_masks.get(word[index], 0)
+                swappable = usable_mask & ~matching
+
+                if index == len(word) - 1:
+                    fits[index] = [matching] + [matching | swappable] * swap_budget
+                else:
+                    fits[index] = [matching & reachable[0]] + [
+                        (matching & reachable[swaps]) | (swappable & reachable[swaps - 1])
+                        for swaps in range(1, swap_budget + 1)
+                    ]
+
+                if not fits[index][swap_budget]:
+                    break
+
+                reachable = [king_dilation(tile_mask) if tile_mask else 0 for tile_mask in fits[index]]
+
+                if changed_mask:
+                    changed_fits[index] = [
+                        (fits[index][swaps] & changed_mask)
+                        | (matching & changed_reachable[swaps])
+                        | (swappable & changed_reachable[swaps - 1] if swaps else 0)
+                        for swaps in range(swap_budget + 1)
+                    ]
+                    changed_reachable = [king_dilation(tile_mask) if tile_mask else 0 for tile_mask in changed_fits[index]]
+
+            start_fits = changed_fits[0] if changed_mask else fits[0]
+
+            suffix_scores = [0] * (len(word) + 1)
+            for index in reversed(range(len(word))):
+                suffix_scores[index] = suffix_scores[index + 1] + letter_values[word[index]]
+
+            # the first tile of a move is never swapped
+            start_mask = start_fits[swap_budget] & letter_masks.get(word[0], 0) if start_fits else 0
+
+            if top_moves is not None and start_mask:
+                # every path needs at least as many swaps as the fewest it
+                # could get away with by crossing itself
+                min_swaps = next(
+                    swaps for swaps in range(swap_budget + 1)
+                    if start_fits[swaps] & letter_masks.get(word[0], 0)
+                )
+                if word_bounds[word_id] <= score_floors[min_swaps]:
+                    continue
+
+            while start_mask:
+                start_bit = start_mask & -start_mask
+                start_mask ^= start_bit
+
+                start_index = start_bit.bit_length() - 1
+                stack = [(SearchNode(None, board_tiles[start_index]), swap_budget, boost_bound - tile_boosts[start_index])]
+
+                while stack:
+                    current_node, swaps_left, boost_left = stack.pop()
+                    index = len(current_node.word())
+                    swaps_used = swap_budget - swaps_left
+
+                    # Prune paths that can't beat the current k-th best move
+                    # with as many swaps, the rest of the word is known so
+                    # only the tiles it lands on are left open
+                    if score_floors is not None and index < len(word):
+                        extra_letter_score = suffix_scores[index] + min(boost_left, MAX_LETTER_BOOST * suffix_scores[index])
+                        score_bound = current_node.score_bound(
+                            self,
+                            extra_letter_score,
+                            len(word) - index,
+                            bool(double_word_mask & ~current_node.visited)
+                        )
+                        if score_bound <= score_floors[swaps_used]:
+                            continue
+
+                    if index == len(word):
+                        score = current_node.score(self)
+                        if score < self.min_score:
+                            continue
+
+                        if top_moves is None:
+                            legal_moves.append(current_node.pack(self, word_id))
+                        elif top_moves.accepts(score, word_id, current_node.swap_count()):
+                            top_moves.add(current_node.pack(self, word_id))
+                            score_floors = top_moves.floors(swap_budget)
                         continue
-                    
-                    new_pos = (new_x, new_y)
-                    if new_pos in visited:
+
+                    matching = letter_masks.get(word[index], 0)
+                    next_mask = neighbour_masks[current_node.y * BOARD_SIZE + current_node.x] & ~current_node.visited
+
+                    if changed_mask and not current_node.visited & changed_mask:
+                        next_fits = changed_fits[index]
+                    else:
+                        next_fits = fits[index]
+
+                    step_mask = next_mask & matching & next_fits[swaps_left]
+                    while step_mask:
+                        step_bit = step_mask & -step_mask
+                        step_mask ^= step_bit
+                        step_index = step_bit.bit_length() - 1
+                        stack.append((
+                            SearchNode(current_node, board_tiles[step_index]), swaps_left, boost_left - tile_boosts[step_index]
+                        ))
+
+                    if swaps_left == 0:
                         continue
-                    
-                    new_node = SearchNode(current_node, adjacent_tile)
-                    new_word = word + adjacent_tile.letter
-                    new_visited = visited | {new_pos}
-                    
-                    if cached_has_prefix(new_word):
-                        stack.append((new_node, new_word, new_visited))
-                    
-                    # Handle swaps
-                    if self.gems >= 3 * (current_node.swap_count() + 1):
-                        for swap_letter in dictionary.alphabet:
-                            if swap_letter == adjacent_tile.letter:
-                                continue
-                            
-                            swap_word = word + swap_letter
-                            if cached_has_prefix(swap_word):
-                                swap_node = SearchNode(current_node, adjacent_tile, True)
-                                swap_node.letter = swap_letter
-                                stack.append((swap_node, swap_word, new_visited))
-        
-        return legal_move_nodes
-    
-    def quick_score_estimate(self, node):
-        score = 0
-        word = node.word()
-        for letter in word:
-            score += Tile(letter, 0, 0).value()
-        if len(word) >= 6:
-            score += 10
-        return score
+
+                    swap_mask = next_mask & ~matching & next_fits[swaps_left]
+                    while swap_mask:
+                        swap_bit = swap_mask & -swap_mask
+                        swap_mask ^= swap_bit
+                        swap_index = swap_bit.bit_length() - 1
+                        stack.append((
+                            SearchNode(current_node, board_tiles[swap_index], True, word[index]),
+                            swaps_left - 1,
+                            boost_left - tile_boosts[swap_index]
+                        ))
+
+        if top_moves is None:
+            return legal_moves
+
+        self.exchange_floors(top_moves)
+        return top_moves.sorted()
+
+
+    def search_units(self, promising_first: bool = False):
+        self.engine = self.choose_engine()
+        if self.engine == "words":
+            # one unit per first letter, largest first
+            candidate_words = self.candidate_words()
+            return [
+                (first_letter,)
+                for first_letter in sorted(candidate_words, key=lambda letter: len(candidate_words[letter]), reverse=True)
+            ]
+
+        return self.tile_units(promising_first)
+
+
+    def tile_units(self, promising_first: bool = False):
+        # every start tile is split into one unit per first step, with
+        # swapping the first step as a separate unit. The neighbour table is
+        # built here once for the board and carried along with every unit,
+        # rather than rebuilt by each unit's search, and so are the tile
+        # boosts the score bound is built from.
+        self.neighbours = self.neighbour_table()
+        self.board_bounds = self.bound_masks()
+        units = []
+        can_swap = self.swap_budget() > 0
+        for tile in self.grid_tiles():
+            if TileModifier.FROZEN in tile.modifiers:
+                continue
+
+            for adjacent_tile in self.usable_neighbours(tile):
+                units.append((tile.x, tile.y, adjacent_tile.x, adjacent_tile.y, False))
+                if can_swap:
+                    units.append((tile.x, tile.y, adjacent_tile.x, adjacent_tile.y, True))
+
+        if promising_first:
+            # start on the most valuable tiles, which tend to produce the
+            # best moves, so a search cut short has likely found them already
+            units.sort(key=self.unit_value, reverse=True)
+        else:
+            # plain first steps can still swap further down, which makes them
+            # the larger units, so hand them out first to keep them from straggling
+            units.sort(key=lambda unit: unit[4])
+
+        return units
+
+
+    def unit_value(self, unit: tuple):
+        x, y, step_x, step_y, swap = unit
+        unit_tiles = [self.tile_at(x, y), self.tile_at(step_x, step_y)]
+
+        return sum(
+            tile.value() if tile.letter in letter_values else 0
+            for tile in unit_tiles
+        )
+
+
+    def timed_legal_moves_from(self, unit: tuple):
+        start_time = perf_counter()
+        if solverpool.is_cancelled(self.generation):
+            # the solve this unit belongs to has already returned
+            return unit, os.getpid(), 0, MoveSet(), False
+
+        if self.engine == "words":
+            moves = self.legal_moves_for_words(*unit)
+        else:
+            moves = self.legal_moves_from(*unit)
+        return unit, os.getpid(), perf_counter() - start_time, MoveSet.from_packed(moves), self.search_complete
+
     
-    def legal_moves_from_parallel(self, start_positions):
-        with Pool(processes=os.cpu_count()) as pool:
-            results = pool.starmap(self.legal_moves_from, start_positions)
-        return [move for sublist in results for move in sublist]
-
-    def legal_moves(self, sort_key=None, sort_reverse: bool = True):
-        start_positions = [
-            (x, y) for y in range(len(self.tiles))
-            for x in range(len(self.tiles[y]))
-            if TileModifier.FROZEN not in self.tile_at(x, y).modifiers
+    def legal_moves_from_parallel(self, units):
+        all_moves = MoveSet()
+        complete = True
+        self.moves_pruned = False
+
+        if self.in_worker:
+            # a pool worker can't hand work to the pool, so the units run
+            # here one after another and check the deadline themselves
+            self.unit_floors = [-1] * (self.swap_budget() + 1)
+            results = map(self.timed_legal_moves_from, units)
+            next_result = lambda timeout: next(results)
+        else:
+            # units are pickled as the pool takes them, which can be after this
+            # returns, so they go out from a copy later solves don't change
+            solver = copy(self)
+            solver.generation = solverpool.new_generation()
+            results = solverpool.get_pool().imap_unordered(solver.timed_legal_moves_from, units)
+            next_result = results.next
+
+        remaining_units = len(units)
+        wait_until = self.deadline
+
+        while remaining_units:
+            timeout = None if wait_until is None else max(0, wait_until - time())
+
+            try:
+                unit, worker, seconds, moves, unit_complete = next_result(timeout)
+            except TimeoutError:
+                if wait_until != self.deadline:
+                    # cancelled units return at once, the stragglers are left
+                    # to notice the cancellation on their own
+                    return all_moves, False
+
+                # Once the deadline passes the units still queued are
+                # cancelled, and the ones running get a moment to stop and
+                # hand in what they found
+                solverpool.cancel(solver.generation)
+                wait_until = self.deadline + CANCEL_GRACE_SECONDS
+                continue
+
+            remaining_units -= 1
+            self.task_timings.append((unit, worker, seconds, len(moves)))
+            all_moves.extend(moves)
+            complete = complete and unit_complete
+            self.peak_move_bytes = max(self.peak_move_bytes, all_moves.nbytes())
+
+            # moves past the index cap aren't indexed anyway, so rather than
+            # holding every path of every word, only the best move of every
+            # word found so far is kept
+            if len(all_moves) > MAX_INDEXED_MOVES:
+                all_moves = self.prune_moves(all_moves, self.split_swaps)
+                self.moves_pruned = True
+
+        self.unit_floors = None
+        return all_moves, complete
+
+
+    def timing_report(self):
+        worker_seconds = {}
+        for _, worker, seconds, _ in self.task_timings:
+            worker_seconds[worker] = worker_seconds.get(worker, 0) + seconds
+
+        if self.cache_hit:
+            lines = [f"served from cache in {self.solve_seconds * 1000:.3f}ms"]
+        else:
+            lines = [f"{len(self.task_timings)} tasks on {len(worker_seconds)} workers in {self.solve_seconds:.2f}s"]
+
+        if not self.cache_hit and self.changed_tile_count is not None:
+            lines.append(f"   re-searched around {self.changed_tile_count} changed tiles")
+
+        for worker, seconds in sorted(worker_seconds.items()):
+            utilisation = seconds / self.solve_seconds if self.solve_seconds else 0
+            lines.append(f"   worker {worker}: busy {seconds:.2f}s ({utilisation:.0%})")
+
+        slowest_timings = sorted(self.task_timings, key=lambda timing: timing[2], reverse=True)
+        for unit, _, seconds, move_count in slowest_timings[:5]:
+            if len(unit) == 1:
+                lines.append(f"   words starting with {unit[0]}: {seconds:.3f}s, {move_count} moves")
+                continue
+
+            x, y, step_x, step_y, swap = unit
+            step = f"swap ({step_x + 1}, {step_y + 1})" if swap else f"({step_x + 1}, {step_y + 1})"
+            lines.append(f"   ({x + 1}, {y + 1}) -> {step}: {seconds:.3f}s, {move_count} moves")
+
+        if not self.cache_hit:
+            lines.append(f"   moves held in at most {self.peak_move_bytes / 1e6:.1f}MB")
+            if self.moves_pruned:
+                lines.append(f"   pruned to the best move of every word past {MAX_INDEXED_MOVES} moves")
+
+        lines.append(get_solve_cache().report())
+        return "\n".join(lines)
+
+
+    def legal_moves(self, sort_key=None, sort_reverse: bool = True, top_k: int | None = None):
+        # with top_k set, only the top_k highest scoring words are searched
+        # for and returned, branches that can't reach them are skipped
+        self.max_swaps = None
+        self.deadline = None
+        self.task_timings = []
+        self.peak_move_bytes = 0
+        self.changed_tile_count = None
+
+        start_time = perf_counter()
+        packed_moves = self.packed_legal_moves(top_k)
+        self.solve_seconds = perf_counter() - start_time
+
+        return self.ranked_moves(packed_moves, sort_key, sort_reverse, top_k)
+
+
+    def legal_moves_by_swaps(
+        self,
+        max_swaps: int = 3,
+        sort_key=None,
+        sort_reverse: bool = True,
+        top_k: int | None = None,
+        time_budget_ms: float = 0
+    ) -> list[list[SearchNode]]:
+        # One search allowing max_swaps swaps, split into the moves for every
+        # swap budget from 0 up to max_swaps. Like the swap options in the
+        # app, each budget is ranked as if holding just the gems it needs.
+        # With a time budget the search can be cut short like solve(), which
+        # leaves search_complete False.
+        gems = self.gems
+        self.gems = max_swaps * 3
+        self.split_swaps = True
+        self.max_swaps = None
+        self.deadline = None
+        self.task_timings = []
+        self.peak_move_bytes = 0
+        self.changed_tile_count = None
+
+        start_time = perf_counter()
+
+        try:
+            if time_budget_ms:
+                packed_moves, self.search_complete = self.timed_packed_moves(time_budget_ms, top_k)
+            else:
+                packed_moves = self.packed_legal_moves(top_k)
+                self.search_complete = True
+
+            swap_counts = ranking.MoveArrays(packed_moves).swap_counts
+
+            moves_by_swaps = []
+            for swap_budget in range(max_swaps + 1):
+                self.gems = swap_budget * 3
+                budget_moves = packed_moves.take(np.flatnonzero(swap_counts <= swap_budget))
+                moves_by_swaps.append(self.ranked_moves(
+                    self.prune_moves(budget_moves), sort_key, sort_reverse, top_k
+                ))
+        finally:
+            self.gems = gems
+            self.split_swaps = False
+
+        self.solve_seconds = perf_counter() - start_time
+        return moves_by_swaps
+
+
+    def packed_legal_moves(self, top_k: int | None):
+        # the moves of a complete solve, taken from the cache, updated from
+        # the previous solve or searched for
+        cache_key = self.cache_key(top_k)
+
+        # workers play boards of their own that never come round again,
+        # so they leave the main process' cache alone
+        packed_moves = None if self.in_worker else get_solve_cache().get(cache_key)
+        self.cache_hit = packed_moves is not None
+        if packed_moves is not None:
+            return packed_moves
+
+        all_moves = self.incremental_moves()
+
+        if all_moves is None:
+            # only a full enumeration can be updated after the next move, so
+            # with incrementalSolves on every move is searched for even with
+            # top_k set, and only cut down to top_k when ranked
+            search_top_k = None if config["incrementalSolves"] else top_k
+            self.top_k = search_top_k
+            # with top_k set, the units likely to find the best moves go first
+            # so the floors the units share rise early
+            all_moves, _ = self.legal_moves_from_parallel(self.search_units(promising_first=search_top_k is not None))
+
+            if search_top_k is None:
+                self.index_moves(all_moves)
+
+        # when splitting by swaps the best move of a word has to be kept
+        # for every swap count, the budgets pick between them afterwards
+        packed_moves = self.prune_moves(all_moves, self.split_swaps)
+        if not self.in_worker:
+            get_solve_cache().put(cache_key, packed_moves)
+        return packed_moves
+
+
+    def solve(
+        self,
+        time_budget_ms: float,
+        sort_key=None,
+        sort_reverse: bool = True,
+        top_k: int | None = None
+    ) -> tuple[list[SearchNode], bool]:
+        # returns the best moves found within the time budget and whether
+        # the search was able to finish
+        self.task_timings = []
+        self.peak_move_bytes = 0
+        self.changed_tile_count = None
+
+        start_time = perf_counter()
+        packed_moves, complete = self.timed_packed_moves(time_budget_ms, top_k)
+        self.solve_seconds = perf_counter() - start_time
+
+        return self.ranked_moves(packed_moves, sort_key, sort_reverse, top_k), complete
+
+
+    def timed_packed_moves(self, time_budget_ms: float, top_k: int | None):
+        # the moves found within the time budget and whether the search was
+        # able to finish. Moves with fewer swaps are searched first, so a cut
+        # short search still covers the cheap moves.
+        cache_key = self.cache_key(top_k)
+        packed_moves = get_solve_cache().get(cache_key)
+        self.cache_hit = packed_moves is not None
+
+        if packed_moves is not None:
+            return packed_moves, True
+
+        self.top_k = top_k
+        self.deadline = time() + time_budget_ms / 1000
+
+        all_moves = MoveSet()
+        complete = True
+
+        try:
+            for max_swaps in range(self.gems // 3 + 1):
+                if time() >= self.deadline:
+                    complete = False
+                    break
+
+                self.max_swaps = max_swaps
+                moves, complete = self.legal_moves_from_parallel(self.search_units(promising_first=True))
+                all_moves.extend(moves)
+
+                if not complete:
+                    break
+        finally:
+            self.max_swaps = None
+            self.deadline = None
+
+        packed_moves = self.prune_moves(all_moves, self.split_swaps)
+        if complete:
+            get_solve_cache().put(cache_key, packed_moves)
+
+        return packed_moves, complete
+
+
+    def tile_states(self):
+        # modifiers are sorted since set iteration order isn't stable
+        return [
+            tile.letter + "".join(sorted(tile.modifiers))
+            for tile in self.grid_tiles()
+        ]
+
+
+    def index_moves(self, move_set: MoveSet):
+        # positions of the moves in move_set by the tiles they cover, unless
+        # there are too many of them or some were pruned while searching
+        if len(move_set) > MAX_INDEXED_MOVES or self.moves_pruned:
+            self.move_index = None
+            self.indexed_moves = None
+            self.indexed_state = None
+            return
+
+        self.indexed_moves = move_set
+        self.move_index = {}
+        for position, row in enumerate(move_set.order):
+            self.move_index.setdefault(move_set.tile_masks[row], array("I")).append(position)
+
+        self.indexed_state = (
+            self.tile_states(),
+            self.swap_budget(),
+            self.match_round == 5
+        )
+
+
+    def incremental_moves(self):
+        # Updates the indexed moves of the previous full solve to the current
+        # board. Moves over unchanged tiles keep their score, so only moves
+        # through a changed tile are dropped and searched for again. Returns
+        # None when the board changed in a way that needs a full solve.
+        if self.move_index is None:
+            return None
+
+        indexed_tiles, indexed_swap_budget, indexed_last_round = self.indexed_state
+        current_tiles = self.tile_states()
+        swap_budget = self.swap_budget()
+
+        if (
+            swap_budget > indexed_swap_budget
+            or indexed_last_round != (self.match_round == 5)
+        ):
+            return None
+
+        changed_indices = [
+            tile_index
+            for tile_index, (indexed_tile, current_tile) in enumerate(zip(indexed_tiles, current_tiles))
+            if indexed_tile != current_tile
         ]
-        all_moves = self.legal_moves_from_parallel(start_positions)
+        changed_mask = 0
+        for tile_index in changed_indices:
+            changed_mask |= 1 << tile_index
+
+        indexed_moves = self.indexed_moves
+        kept_moves = indexed_moves.take(
+            position
+            for tile_mask, positions in self.move_index.items()
+            if not tile_mask & changed_mask
+            for position in positions
+            if indexed_moves.swap_masks[indexed_moves.order[position]].bit_count() <= swap_budget
+        ).compact()
+
+        if changed_mask:
+            # king move distance from every tile to the closest changed tile
+            self.change_distances = [
+                min(
+                    max(
+                        abs(tile_index % BOARD_SIZE - changed_index % BOARD_SIZE),
+                        abs(tile_index // BOARD_SIZE - changed_index // BOARD_SIZE)
+                    )
+                    for changed_index in changed_indices
+                )
+                for tile_index in range(len(current_tiles))
+            ]
+            self.changed_mask = changed_mask
+            self.top_k = None
 
-        pruned_moves = self.prune_moves(all_moves)
+            try:
+                new_moves, _ = self.legal_moves_from_parallel(self.search_units())
+            finally:
+                self.changed_mask = 0
+                self.change_distances = None
+
+            kept_moves.extend(new_moves)
+        else:
+            # nothing was searched for, so nothing was pruned either
+            self.moves_pruned = False
+
+        self.changed_tile_count = len(changed_indices)
+        self.index_moves(kept_moves)
+        return kept_moves
+
+
+    def fingerprint(self, *search_parameters):
+        return "|".join([
+            ",".join(self.tile_states()),
+            str(self.gems),
+            str(self.match_round),
+            repr((self.min_word_length, self.min_score)),
+            repr(search_parameters)
+        ])
+
+
+    def cache_key(self, top_k: int | None):
+        if self.split_swaps:
+            return self.fingerprint(top_k, "by swaps")
+
+        return self.fingerprint(top_k)
+
+
+    def ranked_moves(self, move_set: MoveSet, sort_key, sort_reverse: bool, top_k: int | None):
+        # sort_key is either a Ranking, which orders the moves without making
+        # any SearchNodes, or a key function for the SearchNodes
+        if isinstance(sort_key, ranking.Ranking):
+            return ranking.rank(self, move_set, sort_key, top_k)
+
+        if top_k is not None:
+            move_set = move_set.take(ranking.top_scores(ranking.MoveArrays(move_set), top_k))
+
+        ranked_moves = move_set.take(range(len(move_set)), self)
         if sort_key is not None:
-            pruned_moves.sort(key=sort_key, reverse=sort_reverse)
-        return pruned_moves
-    
+            ranked_moves.sort(key=sort_key, reverse=sort_reverse)
+        return ranked_moves
     
-    def prune_moves(self, moves):
-        word_score_map = {}
-        for move in moves:
-            word = move.word()
-            score = move.score(self)
-            if word not in word_score_map or score > word_score_map[word][0]:
-                word_score_map[word] = (score, move)
-
-        return [move for _, move in word_score_map.values()]
     
+    def prune_moves(self, move_set: MoveSet, by_swaps: bool = False):
+        best_moves = ranking.best_per_word(ranking.MoveArrays(move_set), by_swaps)
+        return move_set.take(best_moves).compact()
+
 
     def evaluate_shuffle(self, top_move: SearchNode) -> tuple[int, bool]:
         if self.gems == 0:
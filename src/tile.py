@@ -28,7 +28,12 @@ letter_values = {
 }
 
 
+BOARD_SIZE = 5
+
+
 class Tile:
+    __slots__ = ("letter", "modifiers", "x", "y")
+
     letter: str
     modifiers: set[str]
     x: int
@@ -0,0 +1,148 @@
+from heapq import heappush, heappop
+
+SWAP_MASK = 1
+SCORE = 3
+GEM_COUNT = 4
+WORD_ID = 5
+TILE_MASK = 6
+
+
+class TopMoves:
+    # Keeps the best scoring packed move for each of the `size` best words.
+    # The heap can hold stale entries for words that were improved or
+    # evicted, those are skipped whenever they reach the top. floor is the
+    # k-th best score other searches of the same solve have found, which
+    # moves have to beat as well, -1 until there is one.
+    size: int
+    moves: dict[int, tuple]
+    floor: int
+
+    def __init__(self, size: int):
+        self.size = size
+        self.moves = {}
+        self.heap = []
+        self.floor = -1
+
+
+    def full(self, swaps_used: int = 0):
+        return len(self.moves) >= self.size or self.floor >= 0
+
+
+    def is_stale(self, entry: tuple):
+        score, word_id = entry
+        move = self.moves.get(word_id)
+        return move is None or move[SCORE] != score
+
+
+    def own_threshold(self):
+        # the score to beat going by the moves kept here alone, -1 while
+        # there's still room
+        if len(self.moves) < self.size:
+            return -1
+
+        while self.is_stale(self.heap[0]):
+            heappop(self.heap)
+
+        return self.heap[0][0]
+
+
+    def threshold(self, swaps_used: int = 0):
+        return max(self.own_threshold(), self.floor)
+
+
+    def own_floors(self):
+        return [self.own_threshold()]
+
+
+    def raise_floors(self, floors: list[int]):
+        self.floor = max(self.floor, floors[0])
+
+
+    def floors(self, max_swaps: int):
+        # the score a move using each number of swaps up to max_swaps has
+        # to beat to get in, -1 while there's still room
+        floor = self.threshold() if self.full() else -1
+        return [floor] * (max_swaps + 1)
+
+
+    def accepts(self, score: int, word_id: int, swaps_used: int = 0):
+        # whether add() would take a move with this score, so moves that
+        # wouldn't get in don't have to be packed first
+        current_move = self.moves.get(word_id)
+        if current_move is not None:
+            return current_move[SCORE] < score
+
+        return not self.full() or score > self.threshold()
+
+
+    def add(self, packed_move: tuple):
+        score = packed_move[SCORE]
+        word_id = packed_move[WORD_ID]
+
+        if not self.accepts(score, word_id):
+            return False
+
+        self.moves[word_id] = packed_move
+        heappush(self.heap, (score, word_id))
+
+        while len(self.moves) > self.size:
+            evicted_score, evicted_word_id = heappop(self.heap)
+            if not self.is_stale((evicted_score, evicted_word_id)):
+                del self.moves[evicted_word_id]
+
+        return True
+
+
+    def sorted(self):
+        return sorted(self.moves.values(), key=lambda move: move[SCORE], reverse=True)
+
+
+class SwapTopMoves:
+    # One TopMoves per number of swaps, so a single search can give the best
+    # moves for every swap budget up to max_swaps. A branch that has used
+    # swaps_used swaps can only end up in the buckets from there on, so it
+    # only has to beat the lowest threshold among those.
+    buckets: list[TopMoves]
+
+    def __init__(self, size: int, max_swaps: int):
+        self.buckets = [TopMoves(size) for _ in range(max_swaps + 1)]
+
+
+    def full(self, swaps_used: int = 0):
+        return all(bucket.full() for bucket in self.buckets[swaps_used:])
+
+
+    def threshold(self, swaps_used: int = 0):
+        return min(bucket.threshold() for bucket in self.buckets[swaps_used:])
+
+
+    def floors(self, max_swaps: int):
+        return [
+            self.threshold(swaps_used) if self.full(swaps_used) else -1
+            for swaps_used in range(max_swaps + 1)
+        ]
+
+
+    def accepts(self, score: int, word_id: int, swaps_used: int = 0):
+        return self.buckets[swaps_used].accepts(score, word_id)
+
+
+    def own_floors(self):
+        return [bucket.own_threshold() for bucket in self.buckets]
+
+
+    def raise_floors(self, floors: list[int]):
+        for bucket, floor in zip(self.buckets, floors):
+            bucket.floor = max(bucket.floor, floor)
+
+
+    def add(self, packed_move: tuple):
+        return self.buckets[packed_move[SWAP_MASK].bit_count()].add(packed_move)
+
+
+    def sorted(self):
+        return sorted(
+            (move for bucket in self.buckets for move in bucket.moves.values()),
+            key=lambda move: move[SCORE],
+            reverse=True
+        )